@@ -0,0 +1,29 @@
+"""add_lower_email_indexes
+
+Revision ID: 7c1e4b9a2d10
+Revises: 345d2c21b2af
+Create Date: 2026-10-19 09:12:41.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '7c1e4b9a2d10'
+down_revision: Union[str, Sequence[str], None] = '345d2c21b2af'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_users_email_lower', 'users', [sa.text('lower(email)')], unique=False)
+    op.create_index('ix_shelters_email_lower', 'shelters', [sa.text('lower(email)')], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_shelters_email_lower', table_name='shelters')
+    op.drop_index('ix_users_email_lower', table_name='users')
@@ -0,0 +1,33 @@
+"""add_pet_favorite_count
+
+Revision ID: a7c3e915d2b8
+Revises: f4b82d6e9a15
+Create Date: 2026-10-19 17:05:12.377804
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'a7c3e915d2b8'
+down_revision: Union[str, Sequence[str], None] = 'f4b82d6e9a15'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('pets', sa.Column('favorite_count', sa.Integer(), server_default='0', nullable=False))
+    op.create_index(op.f('ix_user_favorites_pet_id'), 'user_favorites', ['pet_id'], unique=False)
+    op.execute(
+        "UPDATE pets SET favorite_count = "
+        "(SELECT COUNT(*) FROM user_favorites WHERE user_favorites.pet_id = pets.id)"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_user_favorites_pet_id'), table_name='user_favorites')
+    op.drop_column('pets', 'favorite_count')
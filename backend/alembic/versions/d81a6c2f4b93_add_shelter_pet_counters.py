@@ -0,0 +1,50 @@
+"""add_shelter_pet_counters
+
+Revision ID: d81a6c2f4b93
+Revises: b5d2f0c83e47
+Create Date: 2026-10-19 13:41:08.204117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'd81a6c2f4b93'
+down_revision: Union[str, Sequence[str], None] = 'b5d2f0c83e47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('shelter_pet_counters',
+    sa.Column('shelter_id', sa.Integer(), nullable=False),
+    sa.Column('total', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('available', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('pending', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('adopted', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('on_hold', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+    sa.ForeignKeyConstraint(['shelter_id'], ['shelters.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('shelter_id')
+    )
+    # Backfill every shelter, including those without pets (statuses are stored by enum name)
+    op.execute("""
+        INSERT INTO shelter_pet_counters (shelter_id, total, available, pending, adopted, on_hold)
+        SELECT shelters.id,
+               COUNT(pets.id),
+               SUM(CASE WHEN pets.adoption_status = 'AVAILABLE' THEN 1 ELSE 0 END),
+               SUM(CASE WHEN pets.adoption_status = 'PENDING' THEN 1 ELSE 0 END),
+               SUM(CASE WHEN pets.adoption_status = 'ADOPTED' THEN 1 ELSE 0 END),
+               SUM(CASE WHEN pets.adoption_status = 'ON_HOLD' THEN 1 ELSE 0 END)
+        FROM shelters
+        LEFT JOIN pets ON pets.shelter_id = shelters.id
+        GROUP BY shelters.id
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('shelter_pet_counters')
@@ -0,0 +1,27 @@
+"""add_shelter_inventory_index
+
+Revision ID: e3a9c47b1f26
+Revises: d81a6c2f4b93
+Create Date: 2026-10-19 15:02:44.518330
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'e3a9c47b1f26'
+down_revision: Union[str, Sequence[str], None] = 'd81a6c2f4b93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_pets_shelter_status_created', 'pets', ['shelter_id', 'adoption_status', 'created_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_pets_shelter_status_created', table_name='pets')
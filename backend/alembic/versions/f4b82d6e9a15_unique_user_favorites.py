@@ -0,0 +1,32 @@
+"""unique_user_favorites
+
+Revision ID: f4b82d6e9a15
+Revises: e3a9c47b1f26
+Create Date: 2026-10-19 16:20:37.904112
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'f4b82d6e9a15'
+down_revision: Union[str, Sequence[str], None] = 'e3a9c47b1f26'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Without a constraint, concurrent adds could store the same favorite twice; keep the oldest row
+    op.execute(
+        "DELETE FROM user_favorites WHERE id NOT IN "
+        "(SELECT MIN(id) FROM user_favorites GROUP BY user_id, pet_id)"
+    )
+    op.create_index('ix_user_favorites_user_pet', 'user_favorites', ['user_id', 'pet_id'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_user_favorites_user_pet', table_name='user_favorites')
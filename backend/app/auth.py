@@ -1,13 +1,23 @@
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from typing import Optional
+import uuid
+import hashlib
+import time
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import HTTPException, status, Depends
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import os
 from dotenv import load_dotenv
 from functools import wraps
-from sqlalchemy.orm import Session
+from sqlalchemy import inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
+from sqlalchemy.ext.asyncio import AsyncSession
+from .database import get_db, get_async_db
+from .models import User, Shelter
+from .cache import principal_cache, principal_changed_recently, token_cache
+from .revocation import revocation_list
+from . import password_hashing
 
 load_dotenv()
 
@@ -16,25 +26,40 @@ if not SECRET_KEY:
     raise ValueError("JWT_SECRET_KEY environment variable must be set!")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "14"))
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-def _truncate_72(s: str) -> str:
-    b = s.encode("utf-8")
-    if len(b) <= 72:
-        return s
-    return b[:72].decode("utf-8", errors="ignore")
+def _password_hasher_busy() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="The server is busy. Please try again in a moment.",
+        headers={"Retry-After": "1"},
+    )
 
 def hash_password(password: str) -> str:
-    return pwd_context.hash(_truncate_72(password))
+    try:
+        return password_hashing.hash_password(password)
+    except password_hashing.PasswordHasherBusy:
+        raise _password_hasher_busy()
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     try:
-        return pwd_context.verify(_truncate_72(plain_password), hashed_password)
+        return password_hashing.verify_password(plain_password, hashed_password)
+    except password_hashing.PasswordHasherBusy:
+        raise _password_hasher_busy()
     except Exception as e:
         print(f"Password verification error: {e}")
         return False
 
+def verify_and_update_password(plain_password: str, hashed_password: str):
+    """Verify a password; also returns a fresh hash when the stored one is below the current work factor"""
+    try:
+        return password_hashing.verify_and_update(plain_password, hashed_password)
+    except password_hashing.PasswordHasherBusy:
+        raise _password_hasher_busy()
+    except Exception as e:
+        print(f"Password verification error: {e}")
+        return False, None
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     
     to_encode = data.copy()
@@ -44,72 +69,225 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     else:
         expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex, "type": "access"})
     
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def create_refresh_token(user_id: int, user_type: str) -> str:
+    """Long-lived token that can only be exchanged (once) at /auth/refresh"""
+    to_encode = {
+        "user_id": user_id,
+        "user_type": user_type,
+        "sub": str(user_id),
+        "jti": uuid.uuid4().hex,
+        "type": "refresh",
+        "exp": datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    }
+    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+
+def _credentials_exception(detail: str = "Could not validate credentials") -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail=detail,
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
 def decode_access_token(token: str) -> dict:
+    """Verify an access token and return its claims.
+
+    Verified claims are cached by token digest until the token expires, so a
+    client re-sending the same token skips the signature check.
+    """
+    digest = hashlib.sha256(token.encode("utf-8")).digest()
+    cached = token_cache.get(digest)
+    if cached is not None:
+        return dict(cached)
     
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        raise _credentials_exception()
+    
+    if payload.get("type") == "refresh":
+        raise _credentials_exception()
+    
+    exp = payload.get("exp")
+    if exp is not None:
+        remaining = min(exp - time.time(), token_cache.ttl)
+        if remaining > 0:
+            token_cache.set(digest, dict(payload), ttl=remaining)
+    return payload
+
+def decode_refresh_token(token: str) -> dict:
     
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
     except JWTError:
+        raise _credentials_exception("Invalid refresh token")
+    
+    if payload.get("type") != "refresh" or not payload.get("jti"):
+        raise _credentials_exception("Invalid refresh token")
+    return payload
+
+def revoke_token(db: Session, payload: dict) -> bool:
+    """Revoke a decoded token by its jti until it would have expired anyway"""
+    expires_at = datetime.fromtimestamp(payload["exp"], tz=timezone.utc)
+    return revocation_list.revoke(db, payload["jti"], payload.get("type", "access"), expires_at)
+
+def _attach_principal(db: Session, model, snapshot: dict):
+    """Rebuild a cached principal as a clean, persistent instance of `db` without a SELECT
+
+    Columns left out of the snapshot (hashed_password) are expired and load on first access.
+    """
+    instance = model(**snapshot)
+    make_transient_to_detached(instance)
+    return db.merge(instance, load=False)
+
+security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
+
+def _token_principal(db: Session, credentials: HTTPAuthorizationCredentials) -> tuple:
+    """(principal_type, user_id) of a valid, unrevoked bearer token"""
+    payload = decode_access_token(credentials.credentials)
+    jti = payload.get("jti")
+    if jti and revocation_list.is_revoked(db, jti):
+        raise _credentials_exception("Token has been revoked")
+    
+    user_id = payload.get("user_id")
+    if user_id is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Could not validate credentials",
-            headers={"WWW-Authenticate": "Bearer"},
+            detail="Invalid token payload"
         )
+    
+    return ("shelter" if payload.get("user_type", "user") == "shelter" else "user"), user_id
 
-security = HTTPBearer()
+def _principal_model(principal_type: str):
+    return Shelter if principal_type == "shelter" else User
+
+def _cached_principal(key: tuple) -> Optional[dict]:
+    """The cached snapshot, unless some worker invalidated this principal since it could have been cached"""
+    snapshot = principal_cache.get(key)
+    if snapshot is None or principal_changed_recently(*key):
+        return None
+    return snapshot
 
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
-   
-    from .database import SessionLocal
-    from .models import User, Shelter
+def _load_principal(db: Session, key: tuple):
+    """SELECT the principal and refresh its cache entry"""
+    model = _principal_model(key[0])
+    started = time.monotonic()
+    user = db.query(model).filter(model.id == key[1]).first()
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="User not found"
+        )
+    
+    # expire the entry relative to the read, so a row read before a concurrent
+    # invalidation never outlives that invalidation's marker
+    principal_cache.set(
+        key,
+        {attr.key: getattr(user, attr.key) for attr in inspect(model).column_attrs
+         if attr.key != "hashed_password"},
+        ttl=principal_cache.ttl - (time.monotonic() - started)
+    )
+    return user
+
+def _resolve_principal(db: Session, credentials: HTTPAuthorizationCredentials, fresh: bool = False):
+    try:
+        key = _token_principal(db, credentials)
+        snapshot = None if fresh else _cached_principal(key)
+        if snapshot is not None:
+            return _attach_principal(db, _principal_model(key[0]), snapshot)
+        return _load_principal(db, key)
+    except HTTPException:
+        raise
+    except Exception:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials"
+        )
+
+def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: Session = Depends(get_db)
+):
+    """Load the principal behind the bearer token.
+
+    Uses the request's own session from get_db (FastAPI caches the dependency per
+    request), so the handler gets a session-attached User/Shelter and only one
+    pooled connection is checked out. Served from principal_cache when possible:
+    every change to a user or shelter row calls invalidate_principal, whose marker
+    makes all workers read the row again.
+    """
+    return _resolve_principal(db, credentials)
+
+def get_current_user_fresh(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: Session = Depends(get_db)
+):
+    """get_current_user that always reads the row, for handlers acting on role or is_active"""
+    return _resolve_principal(db, credentials, fresh=True)
+
+def get_optional_current_user(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security),
+    db: Session = Depends(get_db)
+):
+    """Like get_current_user, but anonymous or invalid credentials give None instead of a 401"""
+    if credentials is None:
+        return None
     
+    try:
+        return get_current_user(credentials, db)
+    except HTTPException:
+        return None
+
+def get_optional_token_claims(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)
+) -> Optional[dict]:
+    """Claims of a valid bearer token, or None; no database work, so pair with adopter_id_from_claims"""
+    if credentials is None:
+        return None
     
-    db = SessionLocal()
+    try:
+        return decode_access_token(credentials.credentials)
+    except HTTPException:
+        return None
+
+def adopter_id_from_claims(db: Session, claims: Optional[dict]) -> Optional[int]:
+    """The adopter's user id from optional token claims, or None for anonymous, shelter or revoked tokens"""
+    if not claims or claims.get("user_type", "user") != "user" or claims.get("user_id") is None:
+        return None
     
+    jti = claims.get("jti")
+    if jti and revocation_list.is_revoked(db, jti):
+        return None
+    return claims["user_id"]
+
+async def get_current_user_async(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """get_current_user for async endpoints; the principal is attached to the request's AsyncSession.
+
+    The shared-store marker check runs in the threadpool so it never blocks the event loop.
+    """
     try:
-        
-        token = credentials.credentials
-        
-        
-        payload = decode_access_token(token)
-        user_id = payload.get("user_id")
-        user_type = payload.get("user_type", "user")
-        
-        if user_id is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid token payload"
-            )
-        
-        
-        if user_type == "shelter":
-            user = db.query(Shelter).filter(Shelter.id == user_id).first()
-        else:
-            user = db.query(User).filter(User.id == user_id).first()
-            
-        if user is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="User not found"
-            )
-            
-        return user
-        
+        key = await db.run_sync(lambda session: _token_principal(session, credentials))
+        snapshot = await run_in_threadpool(_cached_principal, key)
+        if snapshot is not None:
+            return await db.run_sync(lambda session: _attach_principal(session, _principal_model(key[0]), snapshot))
+        return await db.run_sync(lambda session: _load_principal(session, key))
     except HTTPException:
         raise
-    except Exception as e:
+    except Exception:
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials"
         )
-    finally:
-        db.close()
 
 def require_role(allowed_roles: list):
     
@@ -131,4 +309,4 @@ def require_role(allowed_roles: list):
             
             return func(*args, current_user=current_user, **kwargs)
         return wrapper
-    return decorator
\ No newline at end of file
+    return decorator
@@ -0,0 +1,112 @@
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+from .shared_store import shared_store
+
+
+class TTLCache:
+    """Small thread-safe LRU cache whose entries expire after a TTL.
+
+    Shared by every worker thread of a process, so all access goes through one lock.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+
+            value, expires_at = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """Store a value; `ttl` overrides the cache default for this entry"""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+
+# Public pet detail payloads served to anonymous viewers
+pet_detail_cache = TTLCache(maxsize=2048, ttl=30)
+
+
+def invalidate_pet(pet_id: int) -> None:
+    pet_detail_cache.delete(pet_id)
+
+
+# Column snapshots of authenticated principals, keyed by (user_type, user_id).
+# Each worker has its own copy, so a change is announced through a marker in the
+# shared store that lives as long as any entry could; while it is set, every
+# worker skips its cached copy. Password hashes are never cached.
+principal_cache = TTLCache(
+    maxsize=int(os.getenv("PRINCIPAL_CACHE_SIZE", "4096")),
+    ttl=float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "60"))
+)
+
+
+def _principal_marker(user_type: str, user_id: int) -> str:
+    return f"principal_changed:{user_type}:{user_id}"
+
+
+def invalidate_principal(user_type: str, user_id: int) -> None:
+    principal_cache.delete((user_type, user_id))
+    key = _principal_marker(user_type, user_id)
+    try:
+        shared_store.clear(key)
+        shared_store.incr(key, math.ceil(principal_cache.ttl))
+    except Exception as e:
+        print(f"Could not publish principal invalidation: {e}")
+
+
+def principal_changed_recently(user_type: str, user_id: int) -> bool:
+    """Whether any worker invalidated this principal within the cache TTL (True if the store is unreachable)"""
+    try:
+        return shared_store.get(_principal_marker(user_type, user_id)) > 0
+    except Exception as e:
+        print(f"Principal invalidation check failed, bypassing cache: {e}")
+        return True
+
+
+# Verified access-token claims keyed by the token's SHA-256 digest. Each entry
+# lives until the token's own exp (capped by the default ttl), so an expired
+# token is never served from here.
+token_cache = TTLCache(
+    maxsize=int(os.getenv("TOKEN_CACHE_SIZE", "4096")),
+    ttl=float(os.getenv("TOKEN_CACHE_TTL_SECONDS", "300"))
+)
@@ -1,13 +1,29 @@
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func
-from typing import List, Optional, Union
+from sqlalchemy.orm import Session, joinedload, load_only
+from sqlalchemy import func, select, insert, update, delete, exists, literal, union_all, and_, or_, bindparam, type_coerce, String
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects import postgresql, sqlite
+from typing import Dict, List, Optional, Union
+from collections import Counter
+from datetime import datetime, timezone
 from . import models, schemas
+from .cache import invalidate_principal
 
 class PetCRUD:
     
     @staticmethod
-    def get_pet(db: Session, pet_id: int) -> Optional[models.Pet]:
-        return db.query(models.Pet).filter(models.Pet.id == pet_id).first()
+    def _load_only(query, fields: Optional[List[str]] = None):
+        """Restrict the SELECT to the requested Pet columns (non-column fields are ignored)"""
+        if not fields:
+            return query
+        columns = [getattr(models.Pet, field) for field in fields if field in models.Pet.__table__.columns]
+        if not columns:
+            return query
+        return query.options(load_only(*columns))
+    
+    @staticmethod
+    def get_pet(db: Session, pet_id: int, fields: Optional[List[str]] = None) -> Optional[models.Pet]:
+        query = PetCRUD._load_only(db.query(models.Pet), fields)
+        return query.filter(models.Pet.id == pet_id).first()
     
     @staticmethod
     def get_pet_with_shelter(db: Session, pet_id: int) -> Optional[models.Pet]:
@@ -16,6 +32,43 @@ class PetCRUD:
             joinedload(models.Pet.shelter)
         ).filter(models.Pet.id == pet_id).first()
     
+    @staticmethod
+    def get_pet_detail(db: Session, pet_id: int, user_id: Optional[int] = None):
+        """Pet + shelter, its favorites count and (optionally) whether user_id favorited it, in one query.
+
+        Returns (pet, favorites_count, is_favorited) or None. The count is the
+        stored favorite_count, so it excludes favorites not flushed yet.
+        """
+        if user_id is not None:
+            is_favorited = exists().where(
+                models.UserFavorite.pet_id == models.Pet.id,
+                models.UserFavorite.user_id == user_id
+            ).correlate(models.Pet)
+        else:
+            is_favorited = literal(False)
+        
+        row = db.query(
+            models.Pet,
+            is_favorited.label("is_favorited")
+        ).options(
+            joinedload(models.Pet.shelter)
+        ).filter(models.Pet.id == pet_id).first()
+        
+        if row is None:
+            return None
+        return row[0], row[0].favorite_count or 0, bool(row[1])
+    
+    @staticmethod
+    def get_pets_by_ids(db: Session, pet_ids: List[int], include_shelter: bool = False,
+                        fields: Optional[List[str]] = None) -> List[models.Pet]:
+        """Load many pets with a single IN query (order is not guaranteed)"""
+        if not pet_ids:
+            return []
+        query = PetCRUD._load_only(db.query(models.Pet), fields)
+        if include_shelter:
+            query = query.options(joinedload(models.Pet.shelter))
+        return query.filter(models.Pet.id.in_(pet_ids)).all()
+    
     @staticmethod
     def _apply_pet_filters(query, pet_type=None, size=None, adoption_status=None, shelter_id=None, 
                           gender=None, age_min=None, age_max=None, city=None, state=None, breed=None, search=None):
@@ -117,10 +170,11 @@ class PetCRUD:
         city: Optional[str] = None,
         state: Optional[str] = None,
         breed: Optional[str] = None,
-        search: Optional[str] = None
+        search: Optional[str] = None,
+        fields: Optional[List[str]] = None
     ) -> List[models.Pet]:
         """Get pets with optional filtering"""
-        query = db.query(models.Pet)
+        query = PetCRUD._load_only(db.query(models.Pet), fields)
         query = PetCRUD._apply_pet_filters(query, pet_type, size, adoption_status, shelter_id,
                                           gender, age_min, age_max, city, state, breed, search)
         return query.offset(skip).limit(limit).all()
@@ -144,7 +198,19 @@ class PetCRUD:
         query = PetCRUD._apply_pet_filters(query, pet_type, size, adoption_status, shelter_id,
                                           gender, age_min, age_max, city, state, breed, search)
         return query.scalar()
-    
+
+    @staticmethod
+    def iter_pets(db: Session, batch_size: int = 500, **filters):
+        """Stream pet rows (plain column tuples, no ORM identity map) in id order.
+
+        yield_per makes psycopg2 use a server-side cursor, so memory stays flat
+        no matter how many pets match.
+        """
+        query = db.query(*models.Pet.__table__.columns)
+        query = PetCRUD._apply_pet_filters(query, **filters)
+        for row in query.order_by(models.Pet.id).yield_per(batch_size):
+            yield row._mapping
+
     @staticmethod
     def get_pets_by_shelter(db: Session, shelter_id: int, adoption_status: Optional[str] = None) -> List[models.Pet]:
         query = db.query(models.Pet).filter(models.Pet.shelter_id == shelter_id)
@@ -157,6 +223,70 @@ class PetCRUD:
                 query = query.filter(models.Pet.adoption_status == models.AdoptionStatus.PENDING)
         return query.all()
     
+    @staticmethod
+    def get_duplicate_candidates(db: Session, shelter_id: int, breeds: List[str], names: List[str]) -> List[models.Pet]:
+        """Available pets of a shelter whose lowercased breed or name is in the given lists (None counts as '')"""
+        pet = models.Pet
+        conditions = [func.lower(pet.breed).in_(breeds), func.lower(pet.name).in_(names)]
+        if "" in breeds:
+            conditions.append(pet.breed.is_(None))
+        return db.query(pet).options(load_only(
+            pet.id, pet.name, pet.breed, pet.age_years, pet.age_months, pet.size, pet.color, pet.gender
+        )).filter(
+            pet.shelter_id == shelter_id,
+            pet.adoption_status == models.AdoptionStatus.AVAILABLE,
+            or_(*conditions)
+        ).all()
+    
+    # sort name -> (column, descending); ties are broken by id in the same direction
+    INVENTORY_SORTS = {
+        "newest": ("created_at", True),
+        "oldest": ("created_at", False),
+        "name": ("name", False),
+        "name_desc": ("name", True),
+    }
+    
+    @staticmethod
+    def get_shelter_inventory(db: Session, shelter_id: int, adoption_status: Optional[models.AdoptionStatus] = None,
+                              sort: str = "newest", limit: int = 20, after: Optional[tuple] = None,
+                              fields: Optional[List[str]] = None) -> List[models.Pet]:
+        """One keyset page of a shelter's pets.
+
+        `after` is the (sort value, id) of the last pet on the previous page, so
+        deep pages cost the same as the first one.
+        """
+        column_name, descending = PetCRUD.INVENTORY_SORTS[sort]
+        column = getattr(models.Pet, column_name)
+        sqlite_timestamp = column_name == "created_at" and db.get_bind().dialect.name == "sqlite"
+        if sqlite_timestamp:
+            # SQLite stores server-default timestamps as 'YYYY-MM-DD HH:MM:SS' text and ones
+            # written through the ORM with '.ffffff'; pad both to full precision so rows
+            # sort and compare the same way whichever form they were stored in
+            column = func.substr(type_coerce(column, String) + ".000000", 1, 26)
+        
+        query = db.query(models.Pet).filter(models.Pet.shelter_id == shelter_id)
+        if adoption_status is not None:
+            query = query.filter(models.Pet.adoption_status == adoption_status)
+        
+        if after is not None:
+            last_value, last_id = after
+            if isinstance(last_value, datetime) and sqlite_timestamp:
+                last_value = literal(last_value.strftime("%Y-%m-%d %H:%M:%S.%f"))
+            if descending:
+                query = query.filter(or_(column < last_value, and_(column == last_value, models.Pet.id < last_id)))
+            else:
+                query = query.filter(or_(column > last_value, and_(column == last_value, models.Pet.id > last_id)))
+        
+        if fields:
+            fields = list(dict.fromkeys(list(fields) + ["id", column_name]))
+        query = PetCRUD._load_only(query, fields)
+        
+        if descending:
+            query = query.order_by(column.desc(), models.Pet.id.desc())
+        else:
+            query = query.order_by(column.asc(), models.Pet.id.asc())
+        return query.limit(limit).all()
+    
     @staticmethod
     def create_pet(db: Session, pet: schemas.PetCreate) -> models.Pet:
         """Create a new pet"""
@@ -165,6 +295,8 @@ class PetCRUD:
             pet_dict.pop('id', None)
             db_pet = models.Pet(**pet_dict)
             db.add(db_pet)
+            db.flush()
+            ShelterPetCounterCRUD.apply_changes(db, db_pet.shelter_id, {db_pet.adoption_status: 1}, total=1)
             db.commit()
             db.refresh(db_pet)
             return db_pet
@@ -176,22 +308,134 @@ class PetCRUD:
             db.rollback()
             raise
     
+    @staticmethod
+    def bulk_create_pets(db: Session, shelter_id: int, pets: List[dict]) -> List[int]:
+        """Insert many pets for one shelter as a single executemany; returns their ids in input order"""
+        if not pets:
+            return []
+        try:
+            result = db.execute(
+                insert(models.Pet).returning(models.Pet.id, sort_by_parameter_order=True),
+                [{**pet, "shelter_id": shelter_id} for pet in pets]
+            )
+            pet_ids = list(result.scalars())
+            statuses = Counter(pet.get("adoption_status") or models.AdoptionStatus.AVAILABLE for pet in pets)
+            ShelterPetCounterCRUD.apply_changes(db, shelter_id, dict(statuses), total=len(pets))
+            db.commit()
+            return pet_ids
+        except Exception:
+            db.rollback()
+            raise
+    
     @staticmethod
     def update_pet(db: Session, pet_id: int, pet_update: schemas.PetUpdate) -> Optional[models.Pet]:
-        """Update an existing pet"""
-        db_pet = db.query(models.Pet).filter(models.Pet.id == pet_id).first()
-        if not db_pet:
-            return None
-        
-        update_data = pet_update.dict(exclude_unset=True)
-        
-        for field, value in update_data.items():
-            if hasattr(db_pet, field):
-                setattr(db_pet, field, value)
-        
+        """Update an existing pet with one UPDATE ... RETURNING.
+
+        A status change first reads the old status (locking the row) so the
+        shelter counters can move. The pet is detached before the commit, so
+        reading it afterwards needs no refresh query.
+        """
+        update_data = {field: value for field, value in pet_update.dict(exclude_unset=True).items()
+                       if hasattr(models.Pet, field)}
+        try:
+            old_status = None
+            if "adoption_status" in update_data:
+                old_status = db.query(models.Pet.adoption_status).filter(
+                    models.Pet.id == pet_id
+                ).with_for_update().scalar()
+                if old_status is None:
+                    return None
+            
+            if update_data:
+                db_pet = db.scalars(
+                    update(models.Pet).where(models.Pet.id == pet_id).values(**update_data).returning(models.Pet)
+                ).first()
+            else:
+                db_pet = db.get(models.Pet, pet_id)
+            if not db_pet:
+                db.rollback()
+                return None
+            
+            if old_status is not None and db_pet.adoption_status != old_status:
+                ShelterPetCounterCRUD.apply_changes(db, db_pet.shelter_id, {old_status: -1, db_pet.adoption_status: 1})
+            
+            db.expunge(db_pet)
+            db.commit()
+            return db_pet
+        except Exception:
+            db.rollback()
+            raise
+    
+    @staticmethod
+    def apply_favorite_count_deltas(db: Session, deltas: Dict[int, int]) -> None:
+        """Add buffered {pet_id: delta} to pets.favorite_count as one executemany"""
+        pets = models.Pet.__table__
+        db.execute(
+            update(pets)
+            .where(pets.c.id == bindparam("target_id"))
+            # keep updated_at: a favorite is not an edit of the pet
+            .values(favorite_count=pets.c.favorite_count + bindparam("delta"), updated_at=pets.c.updated_at),
+            [{"target_id": pet_id, "delta": delta} for pet_id, delta in deltas.items()]
+        )
         db.commit()
-        db.refresh(db_pet)
-        return db_pet
+    
+    @staticmethod
+    def reconcile_favorite_counts(db: Session) -> int:
+        """Reset every favorite_count that differs from COUNT(*) over user_favorites; returns how many changed.
+
+        Does not commit: see FavoriteCountBuffer.reconcile.
+        """
+        pets = models.Pet.__table__
+        favorites = models.UserFavorite.__table__
+        true_count = select(func.count()).select_from(favorites).where(
+            favorites.c.pet_id == pets.c.id
+        ).scalar_subquery()
+        result = db.execute(
+            update(pets)
+            .where(pets.c.favorite_count != true_count)
+            .values(favorite_count=true_count, updated_at=pets.c.updated_at)
+        )
+        return result.rowcount
+    
+    @staticmethod
+    def bulk_update_status(db: Session, shelter_id: int, pet_ids: List[int],
+                           adoption_status: models.AdoptionStatus) -> tuple:
+        """Move a shelter's pets to `adoption_status` with one UPDATE ... RETURNING.
+
+        The rows are locked first so their old statuses give the counter deltas.
+        Returns (updated ids, ids already in that status); ids that are missing
+        or belong to another shelter are in neither.
+        """
+        try:
+            old_statuses = dict(db.query(models.Pet.id, models.Pet.adoption_status).filter(
+                models.Pet.id.in_(pet_ids),
+                models.Pet.shelter_id == shelter_id
+            ).with_for_update().all())
+            unchanged_ids = [pet_id for pet_id, status in old_statuses.items() if status == adoption_status]
+            to_update = [pet_id for pet_id, status in old_statuses.items() if status != adoption_status]
+            if not to_update:
+                db.commit()
+                return [], unchanged_ids
+            
+            result = db.execute(
+                update(models.Pet)
+                .where(models.Pet.id.in_(to_update), models.Pet.shelter_id == shelter_id)
+                .values(adoption_status=adoption_status)
+                .returning(models.Pet.id)
+                .execution_options(synchronize_session=False)
+            )
+            updated_ids = list(result.scalars())
+            
+            status_changes = {adoption_status: len(updated_ids)}
+            for pet_id in updated_ids:
+                old_status = old_statuses[pet_id]
+                status_changes[old_status] = status_changes.get(old_status, 0) - 1
+            ShelterPetCounterCRUD.apply_changes(db, shelter_id, status_changes)
+            db.commit()
+            return updated_ids, unchanged_ids
+        except Exception:
+            db.rollback()
+            raise
     
     @staticmethod
     def delete_pet(db: Session, pet_id: int) -> bool:
@@ -200,10 +444,121 @@ class PetCRUD:
         if not db_pet:
             return False
         
+        shelter_id, old_status = db_pet.shelter_id, db_pet.adoption_status
         db.delete(db_pet)
+        db.flush()
+        ShelterPetCounterCRUD.apply_changes(db, shelter_id, {old_status: -1}, total=-1)
         db.commit()
         return True
 
+
+# Per-shelter pet counts by adoption status
+class ShelterPetCounterCRUD:
+    
+    STATUS_COLUMNS = tuple(status.value for status in models.AdoptionStatus)
+    
+    @staticmethod
+    def _status_column(status) -> Optional[str]:
+        value = getattr(status, "value", status)
+        if value is None:
+            return None
+        value = str(value).lower()
+        return value if value in ShelterPetCounterCRUD.STATUS_COLUMNS else None
+    
+    @staticmethod
+    def ensure(db: Session, shelter_id: int) -> None:
+        """INSERT a zeroed counter row unless the shelter already has one (caller commits)"""
+        table = models.ShelterPetCounter.__table__
+        dialect_insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+        db.execute(dialect_insert(table).values(shelter_id=shelter_id).on_conflict_do_nothing(index_elements=["shelter_id"]))
+    
+    @staticmethod
+    def apply_changes(db: Session, shelter_id: int, status_changes: dict, total: int = 0) -> None:
+        """Add {status: delta} (and `total`) to a shelter's counters in one UPDATE.
+
+        Call after flushing the pet change: if the shelter has no counter row yet,
+        it is built from the pets table instead, which already includes the change.
+        """
+        deltas = {"total": total}
+        for status, delta in status_changes.items():
+            column = ShelterPetCounterCRUD._status_column(status)
+            if column:
+                deltas[column] = deltas.get(column, 0) + delta
+        
+        values = {
+            column: getattr(models.ShelterPetCounter, column) + delta
+            for column, delta in deltas.items() if delta
+        }
+        if not values:
+            return
+        
+        updated = db.query(models.ShelterPetCounter).filter(
+            models.ShelterPetCounter.shelter_id == shelter_id
+        ).update(values, synchronize_session=False)
+        if not updated:
+            ShelterPetCounterCRUD.rebuild(db, shelter_id)
+    
+    @staticmethod
+    def _recount_values() -> dict:
+        """Column -> correlated COUNT over pets, for an UPDATE of shelter_pet_counters"""
+        counter, pet = models.ShelterPetCounter, models.Pet
+        
+        def count(*conditions):
+            return select(func.count(pet.id)).where(pet.shelter_id == counter.shelter_id, *conditions).scalar_subquery()
+        
+        values = {"total": count()}
+        for status in models.AdoptionStatus:
+            values[status.value] = count(pet.adoption_status == status)
+        return values
+    
+    @staticmethod
+    def count(db: Session, shelter_id: int) -> dict:
+        """Recount a shelter's pets with one GROUP BY, without storing anything"""
+        rows = db.query(models.Pet.adoption_status, func.count(models.Pet.id)).filter(
+            models.Pet.shelter_id == shelter_id
+        ).group_by(models.Pet.adoption_status).all()
+        
+        counts = {"total": 0, **{column: 0 for column in ShelterPetCounterCRUD.STATUS_COLUMNS}}
+        for status, count in rows:
+            counts["total"] += count
+            column = ShelterPetCounterCRUD._status_column(status)
+            if column:
+                counts[column] += count
+        return counts
+    
+    @staticmethod
+    def rebuild(db: Session, shelter_id: int) -> None:
+        """Create the shelter's counter row if needed and set it from the pets table (caller commits)"""
+        ShelterPetCounterCRUD.ensure(db, shelter_id)
+        db.query(models.ShelterPetCounter).filter(
+            models.ShelterPetCounter.shelter_id == shelter_id
+        ).update(ShelterPetCounterCRUD._recount_values(), synchronize_session=False)
+    
+    @staticmethod
+    def reconcile(db: Session) -> int:
+        """Give every shelter a counter row and fix the ones that differ from the pets table; returns how many changed"""
+        counter_table = models.ShelterPetCounter.__table__
+        dialect_insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+        # the WHERE keeps SQLite from reading ON CONFLICT as part of the SELECT
+        db.execute(dialect_insert(counter_table).from_select(
+            ["shelter_id"], select(models.Shelter.id).where(models.Shelter.id.isnot(None))
+        ).on_conflict_do_nothing(index_elements=["shelter_id"]))
+        
+        values = ShelterPetCounterCRUD._recount_values()
+        drifted = or_(*(getattr(models.ShelterPetCounter, column) != value for column, value in values.items()))
+        changed = db.query(models.ShelterPetCounter).filter(drifted).update(values, synchronize_session=False)
+        db.commit()
+        return changed
+    
+    @staticmethod
+    def get_counts(db: Session, shelter_id: int) -> dict:
+        """Counter row by primary key; a shelter without one is counted from the pets table (nothing is written)"""
+        counter = db.get(models.ShelterPetCounter, shelter_id)
+        if counter is None:
+            return ShelterPetCounterCRUD.count(db, shelter_id)
+        
+        return {column: getattr(counter, column) for column in ("total",) + ShelterPetCounterCRUD.STATUS_COLUMNS}
+
 # Shelter CRUD operations
 class ShelterCRUD:
     
@@ -221,6 +576,8 @@ class ShelterCRUD:
         """Create a new shelter"""
         db_shelter = models.Shelter(**shelter.dict())
         db.add(db_shelter)
+        db.flush()
+        ShelterPetCounterCRUD.ensure(db, db_shelter.id)
         db.commit()
         db.refresh(db_shelter)
         return db_shelter
@@ -237,6 +594,7 @@ class ShelterCRUD:
             setattr(db_shelter, field, value)
         
         db.commit()
+        invalidate_principal("shelter", shelter_id)
         db.refresh(db_shelter)
         return db_shelter
     
@@ -271,16 +629,24 @@ class UserCRUD:
     
     @staticmethod
     def update_user(db: Session, user_id: int, update_data: dict) -> Optional[models.User]:
-        """Update user data"""
-        db_user = db.query(models.User).filter(models.User.id == user_id).first()
-        if not db_user:
-            return None
-        
-        for field, value in update_data.items():
-            setattr(db_user, field, value)
-        
-        db.commit()
-        db.refresh(db_user)
+        """Update user data with one UPDATE ... RETURNING; values may be SQL expressions over the row.
+
+        The user is detached before the commit, so reading it afterwards needs no refresh query.
+        """
+        try:
+            db_user = db.scalars(
+                update(models.User).where(models.User.id == user_id).values(**update_data).returning(models.User)
+            ).first()
+            if not db_user:
+                db.rollback()
+                return None
+            
+            db.expunge(db_user)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        invalidate_principal("user", user_id)
         return db_user
     
     
@@ -293,48 +659,120 @@ class UserCRUD:
         
         db.delete(db_user)
         db.commit()
+        invalidate_principal("user", user_id)
         return True
 
+# Account lookups spanning users and shelters
+class AccountCRUD:
+    
+    @staticmethod
+    def find_account_by_email(db: Session, email: str):
+        """Resolve an email to (account_type, account_id) with one UNION query.
+
+        Both branches hit the lower(email) expression indexes. account_type is
+        "user" or "shelter"; returns None when the email is not registered.
+        """
+        email_lower = email.lower().strip()
+        users = select(
+            literal("user").label("account_type"),
+            models.User.id.label("account_id")
+        ).where(func.lower(models.User.email) == email_lower)
+        shelters = select(
+            literal("shelter").label("account_type"),
+            models.Shelter.id.label("account_id")
+        ).where(func.lower(models.Shelter.email) == email_lower)
+        return db.execute(union_all(users, shelters).limit(1)).first()
+
 # UserFavorite CRUD operations
 class UserFavoriteCRUD:
     
     @staticmethod
-    def add_favorite(db: Session, user_id: int, pet_id: int) -> Optional[models.UserFavorite]:
-        """Add a pet to user's favorites"""
-        existing = db.query(models.UserFavorite).filter(
+    def _insert_favorites(db: Session, user_id: int, pet_ids: List[int]) -> dict:
+        """INSERT ... SELECT ... ON CONFLICT DO NOTHING RETURNING (caller commits).
+
+        Only pets that exist are inserted and existing favorites are skipped by
+        the unique (user_id, pet_id) index, so concurrent adds cannot duplicate.
+        Returns {pet_id: favorite_id} for the rows actually inserted.
+        """
+        if not pet_ids:
+            return {}
+        table = models.UserFavorite.__table__
+        dialect_insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+        statement = dialect_insert(table).from_select(
+            ["user_id", "pet_id"],
+            select(literal(user_id), models.Pet.id).where(models.Pet.id.in_(pet_ids))
+        ).on_conflict_do_nothing(index_elements=["user_id", "pet_id"]).returning(table.c.pet_id, table.c.id)
+        return {row.pet_id: row.id for row in db.execute(statement)}
+    
+    @staticmethod
+    def _delete_favorites(db: Session, user_id: int, pet_ids: List[int]) -> List[int]:
+        """DELETE ... RETURNING (caller commits); returns the pet ids that were unfavorited"""
+        if not pet_ids:
+            return []
+        table = models.UserFavorite.__table__
+        result = db.execute(
+            delete(table)
+            .where(table.c.user_id == user_id, table.c.pet_id.in_(pet_ids))
+            .returning(table.c.pet_id)
+        )
+        return list(result.scalars())
+    
+    @staticmethod
+    def add_favorite(db: Session, user_id: int, pet_id: int) -> tuple:
+        """Add a pet to user's favorites; returns (favorite id, newly added), with a None id if the pet does not exist"""
+        try:
+            inserted = UserFavoriteCRUD._insert_favorites(db, user_id, [pet_id])
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        if pet_id in inserted:
+            return inserted[pet_id], True
+        
+        return db.query(models.UserFavorite.id).filter(
             models.UserFavorite.user_id == user_id,
             models.UserFavorite.pet_id == pet_id
-        ).first()
-        
-        if existing:
-            return existing  
-        
-        
-        favorite = models.UserFavorite(user_id=user_id, pet_id=pet_id)
-        db.add(favorite)
-        db.commit()
-        db.refresh(favorite)
-        return favorite
+        ).scalar(), False
     
     @staticmethod
     def remove_favorite(db: Session, user_id: int, pet_id: int) -> bool:
         """Remove a pet from user's favorites"""
-        favorite = db.query(models.UserFavorite).filter(
+        try:
+            removed = UserFavoriteCRUD._delete_favorites(db, user_id, [pet_id])
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        return bool(removed)
+    
+    @staticmethod
+    def sync_favorites(db: Session, user_id: int, add_ids: List[int], remove_ids: List[int]) -> tuple:
+        """Apply many adds and removes in one transaction; returns (added pet ids, removed pet ids)"""
+        try:
+            added = UserFavoriteCRUD._insert_favorites(db, user_id, add_ids)
+            removed = UserFavoriteCRUD._delete_favorites(db, user_id, remove_ids)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        return list(added), removed
+    
+    @staticmethod
+    def get_favorited_pet_ids(db: Session, user_id: int, pet_ids: List[int]) -> set:
+        """Which of `pet_ids` the user has favorited, in one query"""
+        if not pet_ids:
+            return set()
+        return {row.pet_id for row in db.query(models.UserFavorite.pet_id).filter(
             models.UserFavorite.user_id == user_id,
-            models.UserFavorite.pet_id == pet_id
-        ).first()
-        
-        if not favorite:
-            return False  
-        
-        db.delete(favorite)
-        db.commit()
-        return True
+            models.UserFavorite.pet_id.in_(pet_ids)
+        )}
     
     @staticmethod
-    def get_user_favorites(db: Session, user_id: int, skip: int = 0, limit: int = 20) -> List[models.Pet]:
+    def get_user_favorites(db: Session, user_id: int, skip: int = 0, limit: int = 20,
+                           fields: Optional[List[str]] = None) -> List[models.Pet]:
         """Get all pets favorited by a user"""
-        return db.query(models.Pet).join(models.UserFavorite).filter(
+        query = PetCRUD._load_only(db.query(models.Pet), fields)
+        return query.join(models.UserFavorite).filter(
             models.UserFavorite.user_id == user_id
         ).offset(skip).limit(limit).all()
     
@@ -356,7 +794,40 @@ class UserFavoriteCRUD:
     
     @staticmethod
     def get_pet_favorites_count(db: Session, pet_id: int) -> int:
-        """Get how many users have favorited this pet"""
-        return db.query(func.count(models.UserFavorite.id)).filter(
-            models.UserFavorite.pet_id == pet_id
-        ).scalar()
\ No newline at end of file
+        """Get how many users have favorited this pet (the stored counter, see app.favorite_counts)"""
+        return db.query(models.Pet.favorite_count).filter(models.Pet.id == pet_id).scalar() or 0
+
+
+# Revoked JWT ids (refresh token rotation and logout)
+class RevokedTokenCRUD:
+    
+    @staticmethod
+    def revoke(db: Session, jti: str, token_type: str, expires_at) -> bool:
+        """False if the jti was already revoked (the unique index decides concurrent calls)"""
+        try:
+            db.add(models.RevokedToken(jti=jti, token_type=token_type, expires_at=expires_at))
+            db.commit()
+            return True
+        except IntegrityError:
+            db.rollback()
+            return False
+    
+    @staticmethod
+    def is_revoked(db: Session, jti: str) -> bool:
+        return db.query(models.RevokedToken.id).filter(models.RevokedToken.jti == jti).first() is not None
+    
+    @staticmethod
+    def get_active_since(db: Session, after_id: int = 0) -> List[tuple]:
+        """(id, jti) of unexpired revocations with id > after_id"""
+        return db.query(models.RevokedToken.id, models.RevokedToken.jti).filter(
+            models.RevokedToken.id > after_id,
+            models.RevokedToken.expires_at > datetime.now(timezone.utc)
+        ).order_by(models.RevokedToken.id).all()
+    
+    @staticmethod
+    def purge_expired(db: Session) -> int:
+        deleted = db.query(models.RevokedToken).filter(
+            models.RevokedToken.expires_at <= datetime.now(timezone.utc)
+        ).delete(synchronize_session=False)
+        db.commit()
+        return deleted
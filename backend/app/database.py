@@ -1,30 +1,275 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 import os
+import sqlite3
+import time
 from dotenv import load_dotenv
+from fastapi import HTTPException, Request, status
+from . import metrics
 
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-engine = create_engine(DATABASE_URL)
+# Pool sizing; pool_size + max_overflow should cover the request threadpool
+# (40 threads by default) or requests will queue for a connection.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Query time budget for every request session, in ms (0 = unlimited); routes can
+# set their own with Depends(query_budget(...)).
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection"""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            metrics.increment("db_pool_timeouts")
+            raise
+        finally:
+            metrics.histogram("db_pool_wait_seconds").observe(time.perf_counter() - started)
+
+
+def _engine_options(url: str) -> dict:
+    options = {"pool_pre_ping": DB_POOL_PRE_PING}
+    database_url = make_url(url)
+    
+    if database_url.get_backend_name() == "sqlite":
+        options["connect_args"] = {"check_same_thread": False}
+        if database_url.database in (None, "", ":memory:"):
+            return options
+    
+    options.update(
+        poolclass=InstrumentedQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE
+    )
+    return options
+
+
+def _register_pool_gauges(prefix: str, pool) -> None:
+    if isinstance(pool, QueuePool):
+        metrics.register_gauge(f"{prefix}_size", pool.size)
+        metrics.register_gauge(f"{prefix}_checked_out", pool.checkedout)
+        metrics.register_gauge(f"{prefix}_checked_in", pool.checkedin)
+        metrics.register_gauge(f"{prefix}_overflow", pool.overflow)
+
+
+engine = create_engine(DATABASE_URL, **_engine_options(DATABASE_URL))
+_register_pool_gauges("db_pool", engine.pool)
+
+# Optional read replica for browse endpoints; without one every read uses `engine`
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
+REPLICA_ENABLED = bool(DATABASE_REPLICA_URL)
+
+if REPLICA_ENABLED:
+    replica_engine = create_engine(DATABASE_REPLICA_URL, **_engine_options(DATABASE_REPLICA_URL))
+    _register_pool_gauges("db_replica_pool", replica_engine.pool)
+else:
+    replica_engine = engine
+
+
+class RoutingSession(Session):
+    """Sends SELECTs to the replica while info["use_replica"] is set; everything else uses the primary.
+
+    DML, and binds requested without a statement (flushes, session.connection()),
+    go to the primary, and after the first of those the session stays there, so a
+    request sees its own changes.
+    """
+    primary_bind = engine
+    replica_bind = replica_engine
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if clause is None or clause.is_dml:
+            self.info["use_replica"] = False
+        elif self.info.get("use_replica") and clause.is_select:
+            return self.replica_bind
+        return self.primary_bind
+
+
+@event.listens_for(RoutingSession, "after_begin")
+def _apply_statement_timeout(session, transaction, connection):
+    """Enforce session.info["statement_timeout_ms"] on each connection the session starts using.
+
+    Postgres gets a transaction-scoped statement_timeout. SQLite has no such
+    setting, so a progress handler aborts the running statement once the
+    budget (measured from the start of the transaction) is spent; it is
+    removed again when the connection goes back to the pool.
+    """
+    timeout_ms = session.info.get("statement_timeout_ms")
+    if not timeout_ms:
+        return
+    
+    backend = connection.dialect.name
+    if backend == "postgresql":
+        connection.exec_driver_sql(f"SET LOCAL statement_timeout = {int(timeout_ms)}")
+    elif backend == "sqlite":
+        raw_connection = connection.connection.driver_connection
+        if isinstance(raw_connection, sqlite3.Connection):
+            deadline = time.monotonic() + timeout_ms / 1000
+            raw_connection.set_progress_handler(lambda: int(time.monotonic() > deadline), 1000)
+
+
+def _clear_progress_handler(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.set_progress_handler(None, 0)
+
+
+for _engine in {engine, replica_engine}:
+    if _engine.dialect.name == "sqlite":
+        event.listen(_engine, "checkin", _clear_progress_handler)
+
+
+def is_statement_timeout(error: BaseException) -> bool:
+    """True for a query cancelled by statement_timeout (Postgres) or the SQLite progress handler"""
+    if not isinstance(error, exc.DBAPIError):
+        return False
+    original = error.orig
+    sqlstate = getattr(original, "pgcode", None) or getattr(original, "sqlstate", None)
+    if sqlstate == "57014":
+        return True
+    return isinstance(original, sqlite3.OperationalError) and "interrupted" in str(original)
+
+
+def _statement_timeout_error(error: BaseException):
+    """503 for a request whose query ran past its budget, or None for any other error.
+
+    Endpoints usually re-raise database errors as a generic 500, so the
+    original exception is looked for in __context__ as well.
+    """
+    original = error.__context__ if isinstance(error, HTTPException) else error
+    if not is_statement_timeout(original):
+        return None
+    metrics.increment("db_statement_timeouts")
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="This request took too long. Please try again with narrower filters.",
+        headers={"Retry-After": "5"},
+    )
+
+
+def query_budget(name: str, default_ms: int):
+    """Route dependency setting the query time budget, overridable with DB_TIMEOUT_<NAME>_MS"""
+    timeout_ms = int(os.getenv(f"DB_TIMEOUT_{name.upper()}_MS", str(default_ms)))
+    
+    def set_query_budget(request: Request) -> None:
+        request.state.statement_timeout_ms = timeout_ms
+    
+    return set_query_budget
+
+
+def _configure_session(db, request: Request) -> None:
+    db.info["use_replica"] = getattr(request.state, "use_replica", False)
+    db.info["statement_timeout_ms"] = getattr(request.state, "statement_timeout_ms", DB_STATEMENT_TIMEOUT_MS)
+
+
+SessionLocal = sessionmaker(class_=RoutingSession, autocommit=False, autoflush=False)
+
+
+
+def _async_url(url: str) -> str:
+    """The same database through its asyncio driver (asyncpg / aiosqlite)"""
+    database_url = make_url(url)
+    backend = database_url.get_backend_name()
+    
+    if backend == "sqlite":
+        return database_url.set(drivername="sqlite+aiosqlite").render_as_string(hide_password=False)
+    
+    if backend in ("postgresql", "postgres"):
+        query = dict(database_url.query)
+        # asyncpg spells libpq's sslmode as ssl
+        if "sslmode" in query:
+            query["ssl"] = query.pop("sslmode")
+        return database_url.set(drivername="postgresql+asyncpg", query=query).render_as_string(hide_password=False)
+    
+    return url
+
+
+def _async_engine_options(url: str) -> dict:
+    options = {"pool_pre_ping": DB_POOL_PRE_PING}
+    database_url = make_url(url)
+    
+    if database_url.get_backend_name() == "sqlite":
+        if database_url.database in (None, "", ":memory:"):
+            return options
+        # aiosqlite defaults to NullPool, which opens a connection (and thread) per request
+        options["poolclass"] = AsyncAdaptedQueuePool
+    
+    options.update(
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE
+    )
+    return options
+
+
+# Used by the read-heavy async endpoints; the rest of the app stays on `engine`
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or _async_url(DATABASE_URL)
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **_async_engine_options(DATABASE_URL))
+
+if REPLICA_ENABLED:
+    async_replica_engine = create_async_engine(_async_url(DATABASE_REPLICA_URL), **_async_engine_options(DATABASE_REPLICA_URL))
+else:
+    async_replica_engine = async_engine
+
+
+class AsyncRoutingSession(RoutingSession):
+    primary_bind = async_engine.sync_engine
+    replica_bind = async_replica_engine.sync_engine
+
+
+AsyncSessionLocal = async_sessionmaker(
+    class_=AsyncSession,
+    sync_session_class=AsyncRoutingSession,
+    autoflush=False,
+    expire_on_commit=False
+)
 
 Base = declarative_base()
 
-def get_db():
+def get_db(request: Request):
     db = SessionLocal()
+    _configure_session(db, request)
     try:
         yield db
+    except Exception as e:
+        timeout_error = _statement_timeout_error(e)
+        if timeout_error is not None:
+            raise timeout_error
+        raise
     finally:
         db.close()
 
+async def get_async_db(request: Request):
+    async with AsyncSessionLocal() as db:
+        _configure_session(db, request)
+        try:
+            yield db
+        except Exception as e:
+            timeout_error = _statement_timeout_error(e)
+            if timeout_error is not None:
+                raise timeout_error
+            raise
+
 def create_tables():
     Base.metadata.create_all(bind=engine)
 
 def recreate_tables():
     """Drop all tables and recreate them"""
     Base.metadata.drop_all(bind=engine)
-    Base.metadata.create_all(bind=engine)
\ No newline at end of file
+    Base.metadata.create_all(bind=engine)
@@ -0,0 +1,154 @@
+"""Write-behind maintenance of pets.favorite_count.
+
+Favorite adds and removes only bump an in-memory delta per pet. A background
+thread flushes the accumulated deltas every FAVORITE_COUNT_FLUSH_SECONDS (or
+sooner once FAVORITE_COUNT_MAX_PENDING pets are dirty) as one batched UPDATE
+that adds to the stored value, so workers never overwrite each other.
+
+Deltas still in memory when a worker dies are lost; reconcile_counters.py
+(run from cron) resets drifted counters to COUNT(*) over user_favorites.
+Resetting while any worker holds unflushed deltas for committed favorites
+would count those twice, so favorite writes call touch() first, which sets a
+marker in the shared store for FAVORITE_COUNT_QUIET_SECONDS. reconcile() only
+commits if that marker was absent both before and after its UPDATE.
+"""
+import os
+import threading
+from typing import Dict, Iterable, Optional
+from .database import SessionLocal
+from .shared_store import shared_store
+from . import crud, metrics
+
+FAVORITE_COUNT_FLUSH_SECONDS = float(os.getenv("FAVORITE_COUNT_FLUSH_SECONDS", "5"))
+FAVORITE_COUNT_QUIET_SECONDS = int(os.getenv("FAVORITE_COUNT_QUIET_SECONDS", "60"))
+FAVORITE_COUNT_MAX_PENDING = int(os.getenv("FAVORITE_COUNT_MAX_PENDING", "1000"))
+
+
+class FavoriteCountBuffer:
+
+    ACTIVITY_KEY = "favorite_counts:active"
+
+    def __init__(self, flush_seconds: float = FAVORITE_COUNT_FLUSH_SECONDS,
+                 quiet_seconds: int = FAVORITE_COUNT_QUIET_SECONDS,
+                 max_pending: int = FAVORITE_COUNT_MAX_PENDING):
+        self.flush_seconds = flush_seconds
+        self.quiet_seconds = quiet_seconds
+        self.max_pending = max_pending
+        self._deltas: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _merge(self, deltas: Dict[int, int]) -> int:
+        with self._lock:
+            for pet_id, delta in deltas.items():
+                value = self._deltas.get(pet_id, 0) + delta
+                if value:
+                    self._deltas[pet_id] = value
+                else:
+                    self._deltas.pop(pet_id, None)
+            return len(self._deltas)
+
+    def touch(self) -> None:
+        """Hold off reconciliation; call before a favorite write and whenever deltas are pending"""
+        try:
+            shared_store.clear(self.ACTIVITY_KEY)
+            shared_store.incr(self.ACTIVITY_KEY, self.quiet_seconds)
+        except Exception as e:
+            print(f"Could not mark favorite activity: {e}")
+
+    def _recently_active(self) -> bool:
+        try:
+            return shared_store.get(self.ACTIVITY_KEY) > 0
+        except Exception as e:
+            print(f"Favorite activity check failed: {e}")
+            return True
+
+    def record(self, pet_ids: Iterable[int], delta: int) -> None:
+        """Buffer +delta for each pet (call after the favorite write has committed)"""
+        if self._merge({pet_id: delta for pet_id in pet_ids}) >= self.max_pending:
+            self._wake.set()
+
+    def pending(self, pet_id: int) -> int:
+        """This worker's not yet flushed delta for a pet"""
+        with self._lock:
+            return self._deltas.get(pet_id, 0)
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._deltas)
+
+    def flush(self) -> int:
+        """Write the buffered deltas in one batch; returns how many pets were updated"""
+        with self._flush_lock:
+            with self._lock:
+                deltas, self._deltas = self._deltas, {}
+            if not deltas:
+                return 0
+
+            self.touch()
+            db = SessionLocal()
+            try:
+                crud.PetCRUD.apply_favorite_count_deltas(db, deltas)
+                return len(deltas)
+            except Exception as e:
+                # put them back so the next flush retries
+                print(f"Favorite count flush failed: {e}")
+                self._merge(deltas)
+                return 0
+            finally:
+                db.close()
+
+    def reconcile(self) -> Optional[int]:
+        """Reset every counter that disagrees with the favorites table.
+
+        Returns how many were fixed, or None when favorites changed recently and
+        nothing was written.
+        """
+        self.flush()
+        if self._recently_active():
+            return None
+        db = SessionLocal()
+        try:
+            fixed = crud.PetCRUD.reconcile_favorite_counts(db)
+            if self._recently_active():
+                db.rollback()
+                return None
+            db.commit()
+            if fixed:
+                metrics.increment("favorite_counts_reconciled", fixed)
+            return fixed
+        except Exception as e:
+            db.rollback()
+            print(f"Favorite count reconciliation failed: {e}")
+            return None
+        finally:
+            db.close()
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            self.flush()
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="favorite-count-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the worker and write whatever is still buffered"""
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_seconds + 5)
+            self._thread = None
+        self.flush()
+
+
+favorite_counts = FavoriteCountBuffer()
+metrics.register_gauge("favorite_counts_pending", favorite_counts.pending_count)
@@ -1,19 +1,26 @@
-from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Request
+from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.encoders import jsonable_encoder
+from fastapi.concurrency import run_in_threadpool
 from fastapi.staticfiles import StaticFiles
+from fastapi.security import HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError
-from .database import get_db, engine, create_tables, recreate_tables
+from .database import get_db, get_async_db, query_budget, REPLICA_ENABLED, engine, create_tables, recreate_tables, SessionLocal
 from .models import User, Pet, Shelter, UserFavorite
 from . import schemas, crud, services, models
-from .auth import get_current_user
+from .auth import get_current_user, get_current_user_async, get_current_user_fresh, get_optional_current_user, get_optional_token_claims
+from .revocation import revocation_list
+from .favorite_counts import favorite_counts
+from .rate_limit import limiter, route_limit
+from .replica import read_from_replica, mark_write
+from . import auth, cache, password_hashing, metrics
 from sqlalchemy import text
 from typing import Optional, List
 from pydantic import ValidationError
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
+from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 import os
 import uuid
@@ -74,8 +81,14 @@ app.add_middleware(
     expose_headers=["*"],
 )
 
-limiter = Limiter(key_func=get_remote_address)
 app.state.limiter = limiter
+
+@app.middleware("http")
+async def track_writes_for_replica(request: Request, call_next):
+    response = await call_next(request)
+    if REPLICA_ENABLED and request.method not in ("GET", "HEAD", "OPTIONS") and response.status_code < 400:
+        await run_in_threadpool(mark_write, request)
+    return response
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
 @app.exception_handler(ValidationError)
@@ -89,6 +102,32 @@ async def validation_exception_handler(request: Request, exc: ValidationError):
 
 app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
 
+@app.on_event("startup")
+def calibrate_password_hashing():
+    password_hashing.calibrate_rounds()
+
+@app.on_event("startup")
+def load_revocation_list():
+    db = SessionLocal()
+    try:
+        revocation_list.load(db)
+    except Exception as e:
+        print(f"Could not load revoked tokens: {e}")
+    finally:
+        db.close()
+
+@app.on_event("startup")
+def start_favorite_counts():
+    favorite_counts.start()
+
+@app.on_event("shutdown")
+def shutdown_password_hashing():
+    password_hashing.shutdown()
+
+@app.on_event("shutdown")
+def stop_favorite_counts():
+    favorite_counts.stop()
+
 @app.get("/", tags=["Root"])
 def read_root():
     return {"message": "Welcome to Paw-tner API!"}
@@ -100,6 +139,14 @@ def health_check():
     """Simple health check endpoint - no database required, perfect for keeping Render awake"""
     return {"status": "ok", "message": "Backend is running"}
 
+@app.get("/metrics", tags=["Health"])
+def get_metrics():
+    """In-process metrics (latency histograms, counters and gauges) for this worker"""
+    return {
+        "bcrypt_rounds": password_hashing.bcrypt_rounds,
+        **metrics.snapshot()
+    }
+
 @app.get("/cors-debug", tags=["Debug"])
 def cors_debug():
     """Debug endpoint to check CORS configuration"""
@@ -169,6 +216,10 @@ def fix_pet_sequence(db: Session = Depends(get_db)):
     
 
 
+# Last revision before this series of migrations; unversioned databases were
+# created by create_all with the models as of this revision
+ALEMBIC_BASELINE_REVISION = "345d2c21b2af"
+
 @app.get("/migrate-database")
 def migrate_database():
     """Apply pending database migrations safely - only adds new tables/columns, never deletes data"""
@@ -177,7 +228,7 @@ def migrate_database():
         from alembic.config import Config
         from alembic.runtime.migration import MigrationContext
         from alembic.script import ScriptDirectory
-        from sqlalchemy import create_engine, inspect, text
+        from sqlalchemy import inspect
         import os
         from pathlib import Path
         
@@ -200,8 +251,6 @@ def migrate_database():
             if not database_url:
                 return {"message": "Migration failed", "error": "DATABASE_URL not set"}
             
-            engine = create_engine(database_url)
-            
             alembic_cfg = Config(str(alembic_cfg_path))
             script_location = backend_dir / "alembic"
             alembic_cfg.set_main_option("script_location", str(script_location))
@@ -215,28 +264,12 @@ def migrate_database():
                 has_data_tables = any(table in existing_tables for table in ['users', 'shelters', 'pets', 'user_favorites'])
                 has_alembic_version = 'alembic_version' in existing_tables
                 
-                # If tables exist but alembic_version doesn't, stamp the database
-                if has_data_tables and not has_alembic_version:
-                    try:
-                        command.stamp(alembic_cfg, "head")
-                        return {
-                            "message": "Database already has tables. Marked migrations as applied.",
-                            "note": "Your tables already exist. All migrations have been marked as complete."
-                        }
-                    except Exception as stamp_error:
-                        # Fallback: manually create alembic_version table
-                        with connection.begin():
-                            connection.execute(text("""
-                                CREATE TABLE IF NOT EXISTS alembic_version (
-                                    version_num VARCHAR(32) NOT NULL, 
-                                    CONSTRAINT alembic_version_pkc PRIMARY KEY (version_num)
-                                )
-                            """))
-                            connection.execute(text("INSERT INTO alembic_version (version_num) VALUES ('345d2c21b2af') ON CONFLICT DO NOTHING"))
-                        return {
-                            "message": "Database already has tables. Marked migrations as applied.",
-                            "note": "Your tables already exist. All migrations have been marked as complete."
-                        }
+                needs_baseline_stamp = has_data_tables and not has_alembic_version
+            
+            # Tables created before migrations were tracked have the baseline schema:
+            # record that, then let the upgrade below apply every later migration
+            if needs_baseline_stamp:
+                command.stamp(alembic_cfg, ALEMBIC_BASELINE_REVISION)
             
             # Try to run migrations normally
             connection = engine.connect()
@@ -249,34 +282,9 @@ def migrate_database():
                     "message": "Database migrations applied successfully!",
                     "note": "This only adds new tables/columns. Your existing data is safe."
                 }
-            except Exception as migration_error:
+            except Exception:
                 connection.close()
-                error_str = str(migration_error)
-                if "already exists" in error_str or "DuplicateTable" in error_str:
-                    # Tables exist but migration failed - stamp the database
-                    try:
-                        command.stamp(alembic_cfg, "head")
-                        return {
-                            "message": "Tables already exist. Marked migrations as applied.",
-                            "note": "Your database is up to date. All migrations have been marked as complete."
-                        }
-                    except Exception:
-                        # Fallback: manually create alembic_version
-                        with engine.connect() as conn:
-                            with conn.begin():
-                                conn.execute(text("""
-                                    CREATE TABLE IF NOT EXISTS alembic_version (
-                                        version_num VARCHAR(32) NOT NULL, 
-                                        CONSTRAINT alembic_version_pkc PRIMARY KEY (version_num)
-                                    )
-                                """))
-                                conn.execute(text("INSERT INTO alembic_version (version_num) VALUES ('345d2c21b2af') ON CONFLICT DO NOTHING"))
-                        return {
-                            "message": "Tables already exist. Marked migrations as applied.",
-                            "note": "Your database is up to date. All migrations have been marked as complete."
-                        }
-                else:
-                    raise migration_error
+                raise
         finally:
             os.chdir(original_cwd)
             
@@ -299,9 +307,9 @@ def recreate_database_tables():
     }
 
 # Pet Endpoints
-@app.get("/pets", response_model=schemas.PetListResponse)
+@app.get("/pets", response_model=schemas.PetListResponse, dependencies=[Depends(read_from_replica), Depends(query_budget("pets", 3000))])
 
-def get_pets(
+async def get_pets(
     skip: int = 0,
     limit: int = 20,
     pet_type: Optional[str] = None,
@@ -316,15 +324,14 @@ def get_pets(
     breed: Optional[str] = None,
     search: Optional[str] = None,
     include_completeness: bool = False,
-    db: Session = Depends(get_db)
+    fields: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+    token_claims: Optional[dict] = Depends(get_optional_token_claims)
 ):
     try:
+        selected_fields = services.PetService.parse_fields(fields, schemas.PetSummary)
         
-        pet_summaries = services.PetService.get_pets_formatted_for_api(
-            db=db,
-            include_completeness=include_completeness,
-            skip=skip,
-            limit=limit,
+        filters = dict(
             pet_type=pet_type,
             size=size,
             adoption_status=adoption_status,
@@ -338,20 +345,27 @@ def get_pets(
             search=search
         )
         
-        total = crud.PetCRUD.get_pets_count(
-            db=db,
-            pet_type=pet_type,
-            size=size,
-            adoption_status=adoption_status,
-            shelter_id=shelter_id,
-            gender=gender,
-            age_min=age_min,
-            age_max=age_max,
-            city=city,
-            state=state,
-            breed=breed,
-            search=search
-        )
+        def load(session: Session):
+            pet_summaries = services.PetService.get_pets_formatted_for_api(
+                db=session,
+                include_completeness=include_completeness,
+                fields=selected_fields,
+                favorites_user_id=auth.adopter_id_from_claims(session, token_claims),
+                skip=skip,
+                limit=limit,
+                **filters
+            )
+            return pet_summaries, crud.PetCRUD.get_pets_count(db=session, **filters)
+        
+        pet_summaries, total = await db.run_sync(load)
+        
+        if selected_fields:
+            return JSONResponse(content=jsonable_encoder({
+                "pets": pet_summaries,
+                "total": total,
+                "page": skip // limit + 1,
+                "size": limit
+            }))
         
         return schemas.PetListResponse(
             pets=pet_summaries,
@@ -359,18 +373,119 @@ def get_pets(
             page=skip // limit + 1,
             size=limit
         )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"Error: {e}")
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail="An error occurred. Please try again.")
 
-@app.get("/pets/{pet_id}", response_model=schemas.Pet)
-def get_pet(pet_id: int, db: Session = Depends(get_db)):
+@app.get("/pets/export", dependencies=[Depends(read_from_replica)])
+def export_pets(
+    request: Request,
+    format: str = "ndjson",
+    pet_type: Optional[str] = None,
+    size: Optional[str] = None,
+    adoption_status: Optional[str] = None,
+    shelter_id: Optional[int] = None,
+    gender: Optional[str] = None,
+    age_min: Optional[int] = None,
+    age_max: Optional[int] = None,
+    city: Optional[str] = None,
+    state: Optional[str] = None,
+    breed: Optional[str] = None,
+    search: Optional[str] = None
+):
+    """Stream every matching pet as NDJSON or CSV for catalog mirroring"""
+    if format not in services.PetService.EXPORT_FORMATS:
+        raise HTTPException(400, f"Invalid format. Use: {', '.join(services.PetService.EXPORT_FORMATS)}")
+
+    filters = dict(
+        pet_type=pet_type,
+        size=size,
+        adoption_status=adoption_status,
+        shelter_id=shelter_id,
+        gender=gender,
+        age_min=age_min,
+        age_max=age_max,
+        city=city,
+        state=state,
+        breed=breed,
+        search=search
+    )
+
+    use_replica = getattr(request.state, "use_replica", False)
+
+    def stream():
+        # The session has to outlive the handler, so the generator owns it
+        db = SessionLocal()
+        db.info["use_replica"] = use_replica
+        try:
+            yield from services.PetService.export_pets(db=db, export_format=format, **filters)
+        finally:
+            db.close()
+
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        stream(),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename=pets.{format}"}
+    )
+
+def _get_pets_batch(db: Session, ids: List[int], include_contact: bool, fields: Optional[str]):
+    try:
+        schema = schemas.PetWithContact if include_contact else schemas.Pet
+        selected_fields = services.PetService.parse_fields(fields, schema)
+        result = services.PetService.get_pets_batch(
+            db=db,
+            pet_ids=ids,
+            include_contact=include_contact,
+            fields=selected_fields
+        )
+        return JSONResponse(content=jsonable_encoder(result))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"Error: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail="An error occurred. Please try again.")
+
+@app.get("/pets/batch", dependencies=[Depends(read_from_replica)])
+def get_pets_batch(ids: str, include_contact: bool = False, fields: Optional[str] = None, db: Session = Depends(get_db)):
+    """Get many pets by id in one call, e.g. /pets/batch?ids=3,1,7"""
+    try:
+        pet_ids = [int(pet_id) for pet_id in ids.split(",") if pet_id.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be a comma separated list of integers")
+    return _get_pets_batch(db, pet_ids, include_contact, fields)
+
+@app.post("/pets/batch")
+def post_pets_batch(batch: schemas.PetBatchRequest, fields: Optional[str] = None, db: Session = Depends(get_db)):
+    """Get many pets by id in one call (for id lists too long for a query string)"""
+    return _get_pets_batch(db, batch.ids, batch.include_contact, fields)
+
+@app.get("/pets/{pet_id}", response_model=schemas.Pet, dependencies=[Depends(read_from_replica)])
+async def get_pet(pet_id: int, fields: Optional[str] = None, db: AsyncSession = Depends(get_async_db)):
     """Get a specific pet by ID"""
     try:
+        selected_fields = services.PetService.parse_fields(fields, schemas.Pet)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        
+        def load(session: Session):
+            pet = services.PetService.get_pet_by_id(db=session, pet_id=pet_id, fields=selected_fields)
+            if selected_fields:
+                return services.PetService.select_fields(pet, selected_fields)
+            return schemas.Pet.from_orm(pet)
         
-        return services.PetService.get_pet_by_id(db=db, pet_id=pet_id)
+        pet = await db.run_sync(load)
+        if selected_fields:
+            return JSONResponse(content=jsonable_encoder(pet))
+        return pet
     except ValueError as e: 
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
@@ -392,6 +507,25 @@ def get_pet_with_contact(pet_id: int, db: Session = Depends(get_db)):
         traceback.print_exc()
         raise HTTPException(status_code=500, detail="An error occurred. Please try again.")
 
+@app.get("/pets/{pet_id}/detail", response_model=schemas.PetDetail, dependencies=[Depends(read_from_replica)])
+def get_pet_detail(pet_id: int, db: Session = Depends(get_db), current_user=Depends(get_optional_current_user)):
+    """Pet with shelter contact, favorites count and the viewer's favorite state in one call"""
+    try:
+        if current_user is None:
+            payload = services.PetService.get_public_pet_detail(db=db, pet_id=pet_id)
+            return JSONResponse(content=payload, headers={"Cache-Control": "public, max-age=30"})
+        
+        user_id = current_user.id if getattr(current_user, '__tablename__', None) == "users" else None
+        detail = services.PetService.get_pet_detail(db=db, pet_id=pet_id, user_id=user_id)
+        return JSONResponse(content=jsonable_encoder(detail), headers={"Cache-Control": "private, no-store"})
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        print(f"Error: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail="An error occurred. Please try again.")
+
 @app.post("/pets", response_model=schemas.Pet)
 def create_pet(
     pet: schemas.PetCreate, 
@@ -483,6 +617,87 @@ def create_pet(
         
         raise HTTPException(status_code=500, detail="An error occurred while creating the pet. Please try again.")
 
+@app.post("/pets/import")
+def import_pets(
+    file: UploadFile = File(...),
+    format: Optional[str] = None,
+    override_duplicate: bool = False,
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user)
+):
+    """Create many pets from a CSV, JSON or NDJSON file (shelter only) and report on every row"""
+    try:
+        user_role = None
+        if hasattr(current_user, 'role') and current_user.role:
+            user_role = current_user.role.value
+        elif hasattr(current_user, '__tablename__') and current_user.__tablename__ == "shelters":
+            user_role = "shelter"
+            
+        if user_role != "shelter":
+            raise HTTPException(403, "Only shelters can import pets")
+        
+        if hasattr(current_user, '__tablename__') and not current_user.is_active:
+            raise HTTPException(403, "Account suspended")
+        
+        max_bytes = services.PetImportService.MAX_BYTES
+        if file.size is not None and file.size > max_bytes:
+            raise HTTPException(400, "File too large (max 10MB)")
+        
+        # file.size is not always known, so never read more than one byte past the limit
+        content = file.file.read(max_bytes + 1)
+        if len(content) > max_bytes:
+            raise HTTPException(400, "File too large (max 10MB)")
+        
+        import_format = services.PetImportService.detect_format(file.filename, format)
+        return services.PetImportService.import_pets(
+            db=db,
+            shelter_id=current_user.id,
+            content=content,
+            import_format=import_format,
+            override_duplicate=override_duplicate
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail="An error occurred while importing pets. Please try again.")
+
+@app.post("/pets/bulk-status")
+def bulk_update_pet_status(update: schemas.PetBulkStatusUpdate, db: Session = Depends(get_db), current_user=Depends(get_current_user)):
+    """Set the adoption status of many of the shelter's own pets in one request"""
+    try:
+        user_role = None
+        if hasattr(current_user, 'role') and current_user.role:
+            user_role = current_user.role.value
+        elif hasattr(current_user, '__tablename__') and current_user.__tablename__ == "shelters":
+            user_role = "shelter"
+            
+        if user_role != "shelter":
+            raise HTTPException(403, "Only shelters can update pets")
+        
+        if hasattr(current_user, '__tablename__') and not current_user.is_active:
+            raise HTTPException(403, "Account suspended")
+        
+        return services.PetService.bulk_update_status(
+            db=db,
+            shelter_id=current_user.id,
+            pet_ids=update.pet_ids,
+            adoption_status=update.adoption_status
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail="An error occurred. Please try again.")
+
 @app.put("/pets/{pet_id}", response_model=schemas.Pet)
 def update_pet(pet_id: int, pet_update: schemas.PetUpdate, db: Session = Depends(get_db), current_user=Depends(get_current_user)):
     """Update an existing pet (shelter only)"""
@@ -595,6 +810,7 @@ def upload_pet_photo(pet_id: int, file: UploadFile = File(...), db: Session = De
         
         pet.primary_photo_url = photo_url
         db.commit()
+        cache.invalidate_pet(pet_id)
         
         return {
             "message": "Photo uploaded successfully",
@@ -639,6 +855,7 @@ def delete_pet_photo(pet_id: int, db: Session = Depends(get_db), current_user=De
         
         pet.primary_photo_url = None
         db.commit()
+        cache.invalidate_pet(pet_id)
         
         return {"message": "Photo deleted successfully"}
         
@@ -652,12 +869,14 @@ def delete_pet_photo(pet_id: int, db: Session = Depends(get_db), current_user=De
 
 # User Endpoints
 @app.post("/users", response_model=schemas.User)
-@limiter.limit("3/minute")
+@limiter.limit(route_limit("register", "3/minute"))
 def create_user(request: Request, user: schemas.UserCreate, db: Session = Depends(get_db)):
     """Create a new user account"""
     try:
         
         return services.UserService.create_user(db=db, user_data=user)
+    except HTTPException:
+        raise
     except ValueError as e:  
         raise HTTPException(status_code=400, detail=str(e))
     except IntegrityError as e:
@@ -671,8 +890,129 @@ def create_user(request: Request, user: schemas.UserCreate, db: Session = Depend
         traceback.print_exc()
         raise HTTPException(status_code=500, detail="An error occurred while creating your account. Please try again.")
 
+def _user_login_response(user: User) -> dict:
+    access_token = services.UserService.create_user_token(user)
+    
+    user_dict = {
+        "id": user.id,
+        "email": user.email,
+        "username": user.username,
+        "full_name": user.full_name,
+        "phone": user.phone,
+        "role": user.role.value if user.role else "adopter",
+        "basic_preferences_complete": user.basic_preferences_complete or False,
+        "extended_preferences_complete": user.extended_preferences_complete or False,
+        "created_at": user.created_at
+    }
+    
+    return {
+        "access_token": access_token,
+        "refresh_token": services.AccountService.create_refresh_token("user", user),
+        "token_type": "bearer",
+        "user": user_dict
+    }
+
+def _shelter_login_response(shelter: Shelter) -> dict:
+    access_token = services.ShelterService.create_shelter_token(shelter)
+    
+    shelter_as_user = {
+        "id": shelter.id,
+        "email": shelter.email,
+        "username": shelter.name,  
+        "full_name": shelter.name,
+        "phone": shelter.phone,
+        "role": "shelter",
+        "basic_preferences_complete": False,
+        "extended_preferences_complete": False,
+        "created_at": shelter.created_at,
+        "preferred_pet_type": None,
+        "activity_level": None,
+        "house_type": None
+    }
+    
+    return {
+        "access_token": access_token,
+        "refresh_token": services.AccountService.create_refresh_token("shelter", shelter),
+        "token_type": "bearer",
+        "user": shelter_as_user
+    }
+
+@app.post("/auth/login", response_model=schemas.TokenResponse)
+@limiter.shared_limit(route_limit("login", "5/minute"), scope="login")
+def account_login(request: Request, login_data: schemas.LoginRequest, db: Session = Depends(get_db)):
+    """Single login for adopters and shelters; the account type is resolved from the email"""
+    try:
+        result = services.AccountService.authenticate(
+            db=db,
+            email=login_data.email,
+            password=login_data.password
+        )
+        
+        if not result:
+            raise HTTPException(401, "Invalid email or password")
+        
+        account_type, account = result
+        if account_type == "shelter":
+            return _shelter_login_response(account)
+        return _user_login_response(account)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        import traceback
+        print(f"Login error: {str(e)}")
+        print(traceback.format_exc())
+        raise HTTPException(status_code=500, detail="An error occurred during login. Please try again.")
+
+@app.post("/auth/refresh", response_model=schemas.TokenResponse)
+@limiter.limit(route_limit("refresh", "30/minute"))
+def refresh_tokens(request: Request, refresh_data: schemas.RefreshRequest, db: Session = Depends(get_db)):
+    """Exchange a refresh token for a new access/refresh pair; the old refresh token stops working"""
+    try:
+        account_type, account = services.AccountService.rotate_refresh_token(db, refresh_data.refresh_token)
+        if account_type == "shelter":
+            return _shelter_login_response(account)
+        return _user_login_response(account)
+        
+    except HTTPException:
+        raise
+    except PermissionError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    except ValueError as e:
+        print(f"Refresh rejected: {str(e)}")
+        raise HTTPException(status_code=401, detail="Invalid refresh token", headers={"WWW-Authenticate": "Bearer"})
+    except Exception as e:
+        print(f"Refresh error: {str(e)}")
+        raise HTTPException(status_code=500, detail="An error occurred. Please log in again.")
+
+@app.post("/auth/logout")
+def logout(
+    logout_data: schemas.LogoutRequest,
+    credentials: HTTPAuthorizationCredentials = Depends(auth.security),
+    current_user=Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Revoke the presented access token and, if given, the caller's refresh token"""
+    try:
+        auth.revoke_token(db, auth.decode_access_token(credentials.credentials))
+        
+        if logout_data.refresh_token:
+            refresh_payload = auth.decode_refresh_token(logout_data.refresh_token)
+            user_type = "shelter" if current_user.__tablename__ == "shelters" else "user"
+            if refresh_payload.get("user_id") != current_user.id or refresh_payload.get("user_type", "user") != user_type:
+                raise HTTPException(400, "Refresh token does not belong to this account")
+            auth.revoke_token(db, refresh_payload)
+        
+        return {"message": "Logged out"}
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Logout error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to log out")
+
 @app.post("/login", response_model=schemas.TokenResponse)
-@limiter.limit("5/minute")
+@limiter.shared_limit(route_limit("login", "5/minute"), scope="login")
 def login(request: Request, login_data: schemas.LoginRequest, db: Session = Depends(get_db)):
     try:
         user = services.UserService.authenticate_user(
@@ -684,25 +1024,7 @@ def login(request: Request, login_data: schemas.LoginRequest, db: Session = Depe
         if not user:
             raise HTTPException(401, "Invalid email or password")
         
-        access_token = services.UserService.create_user_token(user)
-        
-        user_dict = {
-            "id": user.id,
-            "email": user.email,
-            "username": user.username,
-            "full_name": user.full_name,
-            "phone": user.phone,
-            "role": user.role.value if user.role else "adopter",
-            "basic_preferences_complete": user.basic_preferences_complete or False,
-            "extended_preferences_complete": user.extended_preferences_complete or False,
-            "created_at": user.created_at
-        }
-        
-        return {
-            "access_token": access_token,
-            "token_type": "bearer",
-            "user": user_dict
-        }
+        return _user_login_response(user)
         
     except HTTPException:
         raise
@@ -808,9 +1130,13 @@ def get_user_profile_completeness(user_id: int, db: Session = Depends(get_db), c
         traceback.print_exc()
         raise HTTPException(status_code=500, detail="An error occurred. Please try again.")
 
-@app.get("/users/{user_id}/matches")
+@app.get("/users/{user_id}/matches", dependencies=[Depends(query_budget("matches", 2000))])
 def get_user_matches(user_id: int, limit: int = 20, db: Session = Depends(get_db), current_user=Depends(get_current_user)):
-    """Get AI-matched pets for a user (own matches only)"""
+    """Get AI-matched pets for a user (own matches only).
+
+    Scoring every available pet is CPU-bound, so this stays a sync endpoint on
+    the threadpool rather than running inside AsyncSession.run_sync on the event loop.
+    """
     try:
         if current_user.id != user_id:
             raise HTTPException(
@@ -818,11 +1144,11 @@ def get_user_matches(user_id: int, limit: int = 20, db: Session = Depends(get_db
                 detail="You can only access your own matches"
             )
         
-        result = services.MatchingService.get_user_matches_with_validation(
-            db=db, user_id=user_id, limit=limit
-        )
+        result = services.MatchingService.get_user_matches_with_validation(db=db, user_id=user_id, limit=limit)
         
         return JSONResponse(content=jsonable_encoder(result))
+    except HTTPException:
+        raise
     except ValueError as e:  
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
@@ -831,6 +1157,57 @@ def get_user_matches(user_id: int, limit: int = 20, db: Session = Depends(get_db
         traceback.print_exc()
         raise HTTPException(status_code=500, detail="An error occurred while creating your account. Please try again.")
 
+@app.get("/users/{user_id}/dashboard", dependencies=[Depends(query_budget("dashboard", 2000))])
+def get_user_dashboard(
+    user_id: int,
+    matches_limit: int = 20,
+    favorites_limit: int = 20,
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user)
+):
+    """Profile completeness, matches and favorites for the adopter dashboard in one call"""
+    try:
+        if getattr(current_user, '__tablename__', None) != "users" or current_user.id != user_id:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="You can only access your own dashboard"
+            )
+        
+        # current_user is already loaded by the auth dependency, so it is not fetched again
+        result = services.UserService.get_dashboard(
+            db=db,
+            user=current_user,
+            matches_limit=matches_limit,
+            favorites_limit=favorites_limit
+        )
+        
+        return JSONResponse(content=jsonable_encoder(result))
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail="An error occurred. Please try again.")
+
+
+@app.post("/users/{user_id}/favorites/sync")
+def sync_favorites(user_id: int, sync: schemas.FavoriteSyncRequest, db: Session = Depends(get_db), current_user=Depends(get_current_user)):
+    """Apply a batch of queued favorite adds/removes in order; the last operation per pet wins"""
+    try:
+        if current_user.id != user_id:
+            raise HTTPException(403, "You can only manage your own favorites")
+        
+        return services.FavoriteService.sync_favorites(db, user_id, sync.operations)
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"Error: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(500, "An error occurred. Please try again.")
 
 @app.post("/users/{user_id}/favorites/{pet_id}")
 def add_favorite(user_id: int, pet_id: int, db: Session = Depends(get_db), current_user=Depends(get_current_user)):
@@ -838,12 +1215,14 @@ def add_favorite(user_id: int, pet_id: int, db: Session = Depends(get_db), curre
         if current_user.id != user_id:
             raise HTTPException(403, "You can only manage your own favorites")
         
-        pet = crud.PetCRUD.get_pet(db, pet_id)
-        if not pet:
+        favorite_counts.touch()
+        favorite_id, created = crud.UserFavoriteCRUD.add_favorite(db, user_id, pet_id)
+        if favorite_id is None:
             raise HTTPException(404, "Pet not found")
-        
-        favorite = crud.UserFavoriteCRUD.add_favorite(db, user_id, pet_id)
-        return {"message": "Pet added to favorites", "favorite_id": favorite.id}
+        if created:
+            favorite_counts.record([pet_id], 1)
+        cache.invalidate_pet(pet_id)
+        return {"message": "Pet added to favorites", "favorite_id": favorite_id}
     except HTTPException:
         raise
     except Exception as e:
@@ -858,9 +1237,12 @@ def remove_favorite(user_id: int, pet_id: int, db: Session = Depends(get_db), cu
         if current_user.id != user_id:
             raise HTTPException(403, "You can only manage your own favorites")
         
+        favorite_counts.touch()
         success = crud.UserFavoriteCRUD.remove_favorite(db, user_id, pet_id)
         if not success:
             raise HTTPException(404, "Favorite not found")
+        favorite_counts.record([pet_id], -1)
+        cache.invalidate_pet(pet_id)
         
         return {"message": "Pet removed from favorites"}
     except HTTPException:
@@ -872,15 +1254,25 @@ def remove_favorite(user_id: int, pet_id: int, db: Session = Depends(get_db), cu
         raise HTTPException(500, "An error occurred. Please try again.")
 
 @app.get("/users/{user_id}/favorites")
-def get_user_favorites(user_id: int, skip: int = 0, limit: int = 20, db: Session = Depends(get_db), current_user=Depends(get_current_user)):
+async def get_user_favorites(user_id: int, skip: int = 0, limit: int = 20, fields: Optional[str] = None, db: AsyncSession = Depends(get_async_db), current_user=Depends(get_current_user_async)):
     try:
         if current_user.id != user_id:
             raise HTTPException(403, "You can only view your own favorites")
         
-        favorites = crud.UserFavoriteCRUD.get_user_favorites(db, user_id, skip, limit)
-        total = crud.UserFavoriteCRUD.get_user_favorites_count(db, user_id)
+        try:
+            selected_fields = services.PetService.parse_fields(fields, schemas.PetSummary)
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+        
+        def load(session: Session):
+            favorites = crud.UserFavoriteCRUD.get_user_favorites(session, user_id, skip, limit, fields=selected_fields)
+            total = crud.UserFavoriteCRUD.get_user_favorites_count(session, user_id)
+            
+            if selected_fields:
+                return [services.PetService.select_fields(pet, selected_fields) for pet in favorites], total
+            return [schemas.PetSummary.from_orm(pet) for pet in favorites], total
         
-        pet_summaries = [schemas.PetSummary.from_orm(pet) for pet in favorites]
+        pet_summaries, total = await db.run_sync(load)
         
         return {
             "favorites": pet_summaries,
@@ -896,11 +1288,14 @@ def get_user_favorites(user_id: int, skip: int = 0, limit: int = 20, db: Session
         traceback.print_exc()
         raise HTTPException(500, "An error occurred. Please try again.")
 
-@app.get("/shelters")
-def get_shelters(skip: int = 0, limit: int = 20, db: Session = Depends(get_db)):
+@app.get("/shelters", dependencies=[Depends(read_from_replica)])
+async def get_shelters(skip: int = 0, limit: int = 20, db: AsyncSession = Depends(get_async_db)):
     """Get all shelters"""
     try:
-        shelters = services.ShelterService.get_shelters(db=db, skip=skip, limit=limit)
+        shelters = await db.run_sync(lambda session: jsonable_encoder([
+            schemas.Shelter.from_orm(shelter)
+            for shelter in services.ShelterService.get_shelters(db=session, skip=skip, limit=limit)
+        ]))
         return {"shelters": shelters}
     except Exception as e:
         print(f"Error: {e}")
@@ -908,7 +1303,7 @@ def get_shelters(skip: int = 0, limit: int = 20, db: Session = Depends(get_db)):
         traceback.print_exc()
         raise HTTPException(status_code=500, detail="An error occurred. Please try again.")
 
-@app.get("/shelters/{shelter_id}/stats")
+@app.get("/shelters/{shelter_id}/stats", dependencies=[Depends(query_budget("stats", 2000))])
 def get_shelter_stats(shelter_id: int, db: Session = Depends(get_db), current_user=Depends(get_current_user)):
     try:
         user_role = None
@@ -927,20 +1322,15 @@ def get_shelter_stats(shelter_id: int, db: Session = Depends(get_db), current_us
         if not shelter:
             raise HTTPException(404, "Shelter not found")
         
-        try:
-            total_pets = db.execute(text("SELECT COUNT(*) FROM pets WHERE shelter_id = :shelter_id"), {"shelter_id": shelter_id}).scalar() or 0
-            available_pets = db.execute(text("SELECT COUNT(*) FROM pets WHERE shelter_id = :shelter_id AND adoption_status = 'AVAILABLE'"), {"shelter_id": shelter_id}).scalar() or 0
-            adopted_pets = db.execute(text("SELECT COUNT(*) FROM pets WHERE shelter_id = :shelter_id AND adoption_status = 'ADOPTED'"), {"shelter_id": shelter_id}).scalar() or 0
-            pending_pets = db.execute(text("SELECT COUNT(*) FROM pets WHERE shelter_id = :shelter_id AND adoption_status = 'PENDING'"), {"shelter_id": shelter_id}).scalar() or 0
-        except Exception as e:
-            total_pets = available_pets = adopted_pets = pending_pets = 0
+        counts = crud.ShelterPetCounterCRUD.get_counts(db, shelter_id)
         
         return {
             "shelter_name": shelter.name,
-            "total_pets": total_pets,
-            "available_pets": available_pets,
-            "adopted_pets": adopted_pets, 
-            "pending_pets": pending_pets,
+            "total_pets": counts["total"],
+            "available_pets": counts["available"],
+            "adopted_pets": counts["adopted"],
+            "pending_pets": counts["pending"],
+            "on_hold_pets": counts["on_hold"],
             "profile": {
                 "id": shelter.id,
                 "name": shelter.name,
@@ -968,10 +1358,12 @@ def get_shelter_stats(shelter_id: int, db: Session = Depends(get_db), current_us
 
 
 @app.post("/shelters/register", response_model=schemas.Shelter)
-@limiter.limit("3/minute")
+@limiter.limit(route_limit("register", "3/minute"))
 def register_shelter(request: Request, shelter: schemas.ShelterRegister, db: Session = Depends(get_db)):
     try:
         return services.ShelterService.register_shelter(db=db, shelter_data=shelter)
+    except HTTPException:
+        raise
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except IntegrityError as e:
@@ -985,7 +1377,53 @@ def register_shelter(request: Request, shelter: schemas.ShelterRegister, db: Ses
         traceback.print_exc()
         raise HTTPException(status_code=500, detail="An error occurred. Please try again.")
 
-@app.get("/shelters/{shelter_id}/basic")
+@app.get("/shelters/{shelter_id}/pets", dependencies=[Depends(query_budget("inventory", 2000))])
+def get_shelter_inventory(
+    shelter_id: int,
+    adoption_status: Optional[str] = Query(None, alias="status"),
+    sort: str = "newest",
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user)
+):
+    """Page through a shelter's pets (every status) with a keyset cursor, plus per-status counts"""
+    try:
+        user_role = None
+        if hasattr(current_user, 'role') and current_user.role:
+            user_role = current_user.role.value
+        elif hasattr(current_user, '__tablename__') and current_user.__tablename__ == "shelters":
+            user_role = "shelter"
+        
+        if user_role != "shelter" and user_role != "admin":
+            raise HTTPException(403, "Shelter or admin access required")
+        
+        if user_role == "shelter" and current_user.id != shelter_id:
+            raise HTTPException(403, "You can only view your own shelter inventory")
+        
+        selected_fields = services.PetService.parse_fields(fields, schemas.Pet)
+        result = services.PetService.get_shelter_inventory(
+            db=db,
+            shelter_id=shelter_id,
+            adoption_status=adoption_status,
+            sort=sort,
+            limit=limit,
+            cursor=cursor,
+            fields=selected_fields
+        )
+        return JSONResponse(content=jsonable_encoder(result))
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"Error: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail="An error occurred. Please try again.")
+
+@app.get("/shelters/{shelter_id}/basic", dependencies=[Depends(read_from_replica)])
 def get_shelter_basic_info(shelter_id: int, db: Session = Depends(get_db)):
     try:
         shelter = db.query(models.Shelter).filter(models.Shelter.id == shelter_id).first()
@@ -1029,6 +1467,7 @@ def update_shelter_profile(shelter_id: int, shelter_update: dict, db: Session =
                 setattr(shelter, field, value)
         
         db.commit()
+        cache.invalidate_principal("shelter", shelter_id)
         db.refresh(shelter)
         
         return {
@@ -1111,7 +1550,7 @@ def update_shelter(shelter_id: int, shelter_update: schemas.ShelterBase, db: Ses
 
 
 @app.put("/admin/shelters/{shelter_id}/suspend")
-def suspend_shelter(shelter_id: int, current_user=Depends(get_current_user), db: Session = Depends(get_db)):
+def suspend_shelter(shelter_id: int, current_user=Depends(get_current_user_fresh), db: Session = Depends(get_db)):
     if not hasattr(current_user, 'role') or current_user.role.value != "admin":
         raise HTTPException(403, "Admin access required")
     
@@ -1121,10 +1560,11 @@ def suspend_shelter(shelter_id: int, current_user=Depends(get_current_user), db:
     
     shelter.is_active = False
     db.commit()
+    cache.invalidate_principal("shelter", shelter_id)
     return {"message": "Shelter suspended"}
 
 @app.put("/admin/shelters/{shelter_id}/reactivate")
-def reactivate_shelter(shelter_id: int, current_user=Depends(get_current_user), db: Session = Depends(get_db)):
+def reactivate_shelter(shelter_id: int, current_user=Depends(get_current_user_fresh), db: Session = Depends(get_db)):
     if not hasattr(current_user, 'role') or current_user.role.value != "admin":
         raise HTTPException(403, "Admin access required")
     
@@ -1134,10 +1574,11 @@ def reactivate_shelter(shelter_id: int, current_user=Depends(get_current_user),
     
     shelter.is_active = True
     db.commit()
+    cache.invalidate_principal("shelter", shelter_id)
     return {"message": "Shelter reactivated"}
 
 @app.post("/shelters/login", response_model=schemas.TokenResponse)
-@limiter.limit("5/minute")
+@limiter.shared_limit(route_limit("login", "5/minute"), scope="login")
 def shelter_login(request: Request, login_data: schemas.LoginRequest, db: Session = Depends(get_db)):
     """Shelter login endpoint"""
     try:
@@ -1153,28 +1594,7 @@ def shelter_login(request: Request, login_data: schemas.LoginRequest, db: Sessio
                 detail="Invalid email or password"
             )
         
-        access_token = services.ShelterService.create_shelter_token(shelter)
-        
-        shelter_as_user = {
-            "id": shelter.id,
-            "email": shelter.email,
-            "username": shelter.name,  
-            "full_name": shelter.name,
-            "phone": shelter.phone,
-            "role": "shelter",
-            "basic_preferences_complete": False,
-            "extended_preferences_complete": False,
-            "created_at": shelter.created_at,
-            "preferred_pet_type": None,
-            "activity_level": None,
-            "house_type": None
-        }
-        
-        return {
-            "access_token": access_token,
-            "token_type": "bearer",
-            "user": shelter_as_user
-        }
+        return _shelter_login_response(shelter)
         
     except HTTPException:
         raise
@@ -0,0 +1,87 @@
+import bisect
+import threading
+from typing import Callable, Dict, Optional, Sequence
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram (seconds), safe to observe from any thread"""
+
+    def __init__(self, name: str, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+
+        cumulative = 0
+        buckets = {}
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            buckets[f"le_{bound}"] = cumulative
+        buckets["le_inf"] = cumulative + counts[-1]
+
+        return {
+            "count": count,
+            "sum": round(total, 6),
+            "avg": round(total / count, 6) if count else None,
+            "buckets": buckets
+        }
+
+
+_histograms: Dict[str, Histogram] = {}
+_counters: Dict[str, int] = {}
+_gauges: Dict[str, Callable] = {}
+_registry_lock = threading.Lock()
+
+
+def increment(name: str, amount: int = 1) -> None:
+    with _registry_lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def histogram(name: str, buckets: Optional[Sequence[float]] = None) -> Histogram:
+    """Get or create a named histogram"""
+    with _registry_lock:
+        if name not in _histograms:
+            _histograms[name] = Histogram(name, buckets or DEFAULT_BUCKETS)
+        return _histograms[name]
+
+
+def register_gauge(name: str, read) -> None:
+    """Register a callable that reports a current value when metrics are read"""
+    with _registry_lock:
+        _gauges[name] = read
+
+
+def snapshot() -> Dict:
+    with _registry_lock:
+        histograms = dict(_histograms)
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+
+    result = {
+        "histograms": {name: h.snapshot() for name, h in histograms.items()},
+        "counters": counters,
+        "gauges": {}
+    }
+    for name, read in gauges.items():
+        try:
+            result["gauges"][name] = read()
+        except Exception as e:
+            result["gauges"][name] = f"error: {e}"
+    return result
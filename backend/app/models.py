@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, ForeignKey, Enum, Float
+from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, ForeignKey, Enum, Float, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from .database import Base
@@ -78,6 +78,9 @@ class User(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
+# Emails are matched case-insensitively, which needs an expression index
+Index("ix_users_email_lower", func.lower(User.email))
+
 class Shelter(Base):
     __tablename__ = "shelters"
     
@@ -106,6 +109,8 @@ class Shelter(Base):
     
     pets = relationship("Pet", back_populates="shelter")
 
+Index("ix_shelters_email_lower", func.lower(Shelter.email))
+
 class Pet(Base):
     __tablename__ = "pets"
     
@@ -148,14 +153,42 @@ class Pet(Base):
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
     match_score = Column(Float)
+    # Denormalized COUNT of user_favorites rows, maintained by app.favorite_counts
+    favorite_count = Column(Integer, nullable=False, default=0, server_default="0")
+
+Index("ix_pets_shelter_status_created", Pet.shelter_id, Pet.adoption_status, Pet.created_at)
+
+class ShelterPetCounter(Base):
+    """Per-shelter pet totals by adoption status, kept in step by the PetCRUD write paths"""
+    __tablename__ = "shelter_pet_counters"
+    
+    shelter_id = Column(Integer, ForeignKey("shelters.id", ondelete="CASCADE"), primary_key=True)
+    total = Column(Integer, nullable=False, default=0, server_default="0")
+    available = Column(Integer, nullable=False, default=0, server_default="0")
+    pending = Column(Integer, nullable=False, default=0, server_default="0")
+    adopted = Column(Integer, nullable=False, default=0, server_default="0")
+    on_hold = Column(Integer, nullable=False, default=0, server_default="0")
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
 class UserFavorite(Base):
     __tablename__ = "user_favorites"
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    pet_id = Column(Integer, ForeignKey("pets.id"), nullable=False)
+    pet_id = Column(Integer, ForeignKey("pets.id"), nullable=False, index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     user = relationship("User")
-    pet = relationship("Pet")
\ No newline at end of file
+    pet = relationship("Pet")
+
+# One favorite per (user, pet); favorite writes rely on it for ON CONFLICT DO NOTHING
+Index("ix_user_favorites_user_pet", UserFavorite.user_id, UserFavorite.pet_id, unique=True)
+
+class RevokedToken(Base):
+    __tablename__ = "revoked_tokens"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    jti = Column(String(64), unique=True, index=True, nullable=False)
+    token_type = Column(String(20), nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    revoked_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
@@ -0,0 +1,186 @@
+"""Runs bcrypt off the request threadpool.
+
+Hashes and verifications go to a small process pool sized to the CPU count.
+Only PASSWORD_HASH_MAX_PENDING jobs may be queued or running at once; anything
+beyond that is rejected straight away with PasswordHasherBusy, so a login burst
+can't tie up every threadpool slot the other endpoints need.
+
+This module is imported by the worker processes as well, so it must only depend
+on passlib (and the dependency-free metrics module).
+"""
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from passlib.context import CryptContext
+from . import metrics
+
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", str(max(PASSWORD_HASH_WORKERS, 1) * 4)))
+PASSWORD_HASH_TIMEOUT_SECONDS = float(os.getenv("PASSWORD_HASH_TIMEOUT_SECONDS", "10"))
+
+# Work factor: pinned with BCRYPT_ROUNDS, otherwise picked by calibrate_rounds()
+# so that one hash takes about BCRYPT_TARGET_MS on this machine.
+BCRYPT_TARGET_MS = float(os.getenv("BCRYPT_TARGET_MS", "250"))
+BCRYPT_MIN_ROUNDS = int(os.getenv("BCRYPT_MIN_ROUNDS", "10"))
+BCRYPT_MAX_ROUNDS = int(os.getenv("BCRYPT_MAX_ROUNDS", "15"))
+BCRYPT_DEFAULT_ROUNDS = 12
+
+bcrypt_rounds = int(os.getenv("BCRYPT_ROUNDS", str(BCRYPT_DEFAULT_ROUNDS)))
+
+_contexts = {}
+
+
+def get_context(rounds: int) -> CryptContext:
+    """CryptContext hashing at `rounds`; weaker hashes report needs_update, stronger ones are kept"""
+    context = _contexts.get(rounds)
+    if context is None:
+        context = CryptContext(
+            schemes=["bcrypt"],
+            deprecated="auto",
+            bcrypt__default_rounds=rounds,
+            bcrypt__min_rounds=rounds,
+            bcrypt__max_rounds=31
+        )
+        _contexts[rounds] = context
+    return context
+
+
+class PasswordHasherBusy(Exception):
+    """The hashing pool is saturated or did not answer in time"""
+
+
+def _truncate_72(s: str) -> str:
+    b = s.encode("utf-8")
+    if len(b) <= 72:
+        return s
+    return b[:72].decode("utf-8", errors="ignore")
+
+
+def _hash(password: str, rounds: int) -> str:
+    return get_context(rounds).hash(_truncate_72(password))
+
+
+def _verify(plain_password: str, hashed_password: str, rounds: int) -> bool:
+    return get_context(rounds).verify(_truncate_72(plain_password), hashed_password)
+
+
+def _verify_and_update(plain_password: str, hashed_password: str, rounds: int):
+    return get_context(rounds).verify_and_update(_truncate_72(plain_password), hashed_password)
+
+
+def calibrate_rounds(target_ms: float = BCRYPT_TARGET_MS) -> int:
+    """Pick the largest work factor whose hash time stays under target_ms on this machine.
+
+    Times a cheap hash and extrapolates (each extra round doubles the cost).
+    BCRYPT_ROUNDS, when set, wins over calibration.
+    """
+    global bcrypt_rounds
+    if os.getenv("BCRYPT_ROUNDS"):
+        return bcrypt_rounds
+
+    probe_rounds = 8
+    probe_context = get_context(probe_rounds)
+    samples = []
+    for _ in range(3):
+        started = time.perf_counter()
+        probe_context.hash("calibration-probe")
+        samples.append(time.perf_counter() - started)
+    probe_ms = min(samples) * 1000
+
+    rounds = BCRYPT_MIN_ROUNDS
+    while rounds < BCRYPT_MAX_ROUNDS and probe_ms * 2 ** (rounds + 1 - probe_rounds) <= target_ms:
+        rounds += 1
+
+    bcrypt_rounds = rounds
+    print(f"bcrypt calibrated: {rounds} rounds (~{probe_ms * 2 ** (rounds - probe_rounds):.0f} ms per hash, target {target_ms:.0f} ms)")
+    return rounds
+
+
+_executor = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(max(PASSWORD_HASH_MAX_PENDING, 1))
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn, not fork: forking a multi-threaded server can copy held locks
+            _executor = ProcessPoolExecutor(
+                max_workers=PASSWORD_HASH_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _executor
+
+
+def _reset_executor() -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def run(fn, *args):
+    """Run a hashing function in the pool, or raise PasswordHasherBusy"""
+    if PASSWORD_HASH_WORKERS <= 0:
+        return fn(*args)
+
+    if not _slots.acquire(blocking=False):
+        metrics.increment("password_hash_rejected")
+        raise PasswordHasherBusy("Password hashing queue is full")
+
+    try:
+        future = _get_executor().submit(fn, *args)
+    except BrokenProcessPool:
+        _slots.release()
+        _reset_executor()
+        raise PasswordHasherBusy("Password hashing pool restarted")
+    except BaseException:
+        _slots.release()
+        raise
+    # The slot is freed when the job is really gone (done or cancelled), so
+    # jobs that outlive their caller still count against MAX_PENDING
+    future.add_done_callback(lambda _: _slots.release())
+
+    try:
+        return future.result(timeout=PASSWORD_HASH_TIMEOUT_SECONDS)
+    except FutureTimeoutError:
+        # Drops the job if it is still queued; a running one keeps its slot until it ends
+        future.cancel()
+        raise PasswordHasherBusy("Password hashing timed out")
+    except BrokenProcessPool:
+        _reset_executor()
+        raise PasswordHasherBusy("Password hashing pool restarted")
+
+
+def _timed(metric: str, fn, *args):
+    started = time.perf_counter()
+    try:
+        return run(fn, *args)
+    finally:
+        metrics.histogram(metric).observe(time.perf_counter() - started)
+
+
+def hash_password(password: str) -> str:
+    return _timed("password_hash_seconds", _hash, password, bcrypt_rounds)
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return _timed("password_verify_seconds", _verify, plain_password, hashed_password, bcrypt_rounds)
+
+
+def verify_and_update(plain_password: str, hashed_password: str):
+    """(verified, new_hash); new_hash is set when the stored hash is weaker than the current work factor"""
+    return _timed("password_verify_seconds", _verify_and_update, plain_password, hashed_password, bcrypt_rounds)
+
+
+def shutdown() -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+        _executor = None
@@ -0,0 +1,66 @@
+"""Rate limiting shared by every worker process.
+
+slowapi keeps its counters in process memory by default, so each worker
+enforced its own copy of every limit. Here the counters live in the shared
+store named by RATE_LIMIT_STORAGE_URI (see shared_store).
+
+Limits use the moving-window strategy (fixed-window also works; the SQLite
+store does not implement sliding-window-counter) and are keyed per authenticated
+principal, or per client IP for anonymous requests. Any route limit can be
+overridden with RATE_LIMIT_<NAME>, e.g. RATE_LIMIT_LOGIN="10/minute".
+"""
+import os
+from typing import Optional
+from fastapi import Request
+from fastapi.security.utils import get_authorization_scheme_param
+from slowapi import Limiter
+from slowapi.util import get_remote_address
+from . import auth
+from .shared_store import RATE_LIMIT_STORAGE_URI
+
+RATE_LIMIT_STRATEGY = os.getenv("RATE_LIMIT_STRATEGY", "moving-window")
+if RATE_LIMIT_STRATEGY == "sliding-window-counter" and RATE_LIMIT_STORAGE_URI.startswith("sqlite"):
+    raise ValueError("RATE_LIMIT_STRATEGY=sliding-window-counter needs a storage other than sqlite://")
+# Number of reverse proxies in front of the app that append to X-Forwarded-For.
+# 0 ignores the header, since clients can set it to anything.
+RATE_LIMIT_TRUSTED_PROXIES = int(os.getenv("RATE_LIMIT_TRUSTED_PROXIES", "0"))
+
+
+def client_ip(request: Request) -> str:
+    """Client address, taken from X-Forwarded-For only as far as RATE_LIMIT_TRUSTED_PROXIES allows"""
+    if RATE_LIMIT_TRUSTED_PROXIES > 0:
+        forwarded = [part.strip() for part in request.headers.get("x-forwarded-for", "").split(",") if part.strip()]
+        if forwarded:
+            return forwarded[max(len(forwarded) - RATE_LIMIT_TRUSTED_PROXIES, 0)]
+    return get_remote_address(request)
+
+
+def principal_key(request: Request) -> Optional[str]:
+    """"<user_type>:<user_id>" from a valid bearer token, or None for anonymous callers"""
+    scheme, token = get_authorization_scheme_param(request.headers.get("authorization"))
+    if scheme.lower() == "bearer" and token:
+        try:
+            payload = auth.decode_access_token(token)
+            if payload.get("user_id") is not None:
+                return f"{payload.get('user_type', 'user')}:{payload['user_id']}"
+        except Exception:
+            pass
+    return None
+
+
+def rate_limit_key(request: Request) -> str:
+    """Authenticated callers are limited per account, everyone else per client IP"""
+    return principal_key(request) or f"ip:{client_ip(request)}"
+
+
+def route_limit(name: str, default: str) -> str:
+    """Limit string for a route, overridable with RATE_LIMIT_<NAME>"""
+    return os.getenv(f"RATE_LIMIT_{name.upper()}", default)
+
+
+limiter = Limiter(
+    key_func=rate_limit_key,
+    storage_uri=RATE_LIMIT_STORAGE_URI,
+    strategy=RATE_LIMIT_STRATEGY,
+    in_memory_fallback_enabled=True
+)
@@ -0,0 +1,49 @@
+"""Which requests may read from the replica (see database.RoutingSession).
+
+Browse endpoints opt in with `dependencies=[Depends(read_from_replica)]`.
+After a signed-in caller writes anything, their reads go to the primary for
+REPLICA_STICKY_SECONDS so they see their own changes despite replication lag.
+Anonymous requests (logins, registrations) never pin: keyed by IP, one
+busy proxy address would send everyone's reads to the primary.
+The "wrote recently" marks live in the shared store, so all workers see them.
+"""
+import os
+from typing import Optional
+from fastapi import Request
+from .database import REPLICA_ENABLED
+from .rate_limit import principal_key
+from .shared_store import shared_store
+
+REPLICA_STICKY_SECONDS = int(os.getenv("REPLICA_STICKY_SECONDS", "10"))
+
+_recent_writes = shared_store if REPLICA_ENABLED else None
+
+
+def _writer_key(request: Request) -> Optional[str]:
+    principal = principal_key(request)
+    return f"primary:{principal}" if principal else None
+
+
+def mark_write(request: Request) -> None:
+    """Pin a signed-in caller's reads to the primary for the next REPLICA_STICKY_SECONDS"""
+    key = _writer_key(request) if _recent_writes is not None else None
+    if key is None:
+        return
+    try:
+        _recent_writes.clear(key)
+        _recent_writes.incr(key, REPLICA_STICKY_SECONDS)
+    except Exception as e:
+        print(f"Could not record write for replica stickiness: {e}")
+
+
+def read_from_replica(request: Request) -> None:
+    """Route dependency: let this GET read from the replica unless the caller wrote recently"""
+    if _recent_writes is None or request.method not in ("GET", "HEAD"):
+        return
+    key = _writer_key(request)
+    try:
+        wrote_recently = key is not None and _recent_writes.get(key) > 0
+    except Exception as e:
+        print(f"Replica stickiness check failed, using primary: {e}")
+        wrote_recently = True
+    request.state.use_replica = not wrote_recently
@@ -0,0 +1,111 @@
+"""Revoked-token checks without a database round trip per request.
+
+Revocations live in the revoked_tokens table. Each worker keeps a Bloom filter
+of the unexpired ones, loaded at startup and topped up with new rows at most
+once every REVOCATION_SYNC_SECONDS, which bounds how long a revocation made by
+another worker can go unnoticed. A negative answer from the filter is trusted;
+a positive one is confirmed against the table, so false positives never lock
+anyone out.
+"""
+import hashlib
+import math
+import os
+import threading
+import time
+from sqlalchemy.orm import Session
+from . import crud
+
+REVOCATION_BLOOM_CAPACITY = int(os.getenv("REVOCATION_BLOOM_CAPACITY", "100000"))
+REVOCATION_BLOOM_ERROR_RATE = float(os.getenv("REVOCATION_BLOOM_ERROR_RATE", "0.001"))
+REVOCATION_SYNC_SECONDS = float(os.getenv("REVOCATION_SYNC_SECONDS", "30"))
+
+
+class BloomFilter:
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = max(capacity, 1)
+        self.size = max(8, int(-self.capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, key: str) -> None:
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class RevocationList:
+
+    def __init__(self, capacity: int = REVOCATION_BLOOM_CAPACITY, error_rate: float = REVOCATION_BLOOM_ERROR_RATE,
+                 sync_seconds: float = REVOCATION_SYNC_SECONDS):
+        self.error_rate = error_rate
+        self.sync_seconds = sync_seconds
+        self._filter = BloomFilter(capacity, error_rate)
+        self._last_id = 0
+        self._last_sync = 0.0
+        self._lock = threading.Lock()
+
+    def load(self, db: Session) -> None:
+        """Rebuild the filter from every unexpired revocation"""
+        crud.RevokedTokenCRUD.purge_expired(db)
+        rows = crud.RevokedTokenCRUD.get_active_since(db)
+        capacity = max(REVOCATION_BLOOM_CAPACITY, len(rows) * 2)
+        bloom = BloomFilter(capacity, self.error_rate)
+        for _, jti in rows:
+            bloom.add(jti)
+
+        with self._lock:
+            self._filter = bloom
+            self._last_id = rows[-1][0] if rows else 0
+            self._last_sync = time.monotonic()
+
+    def _sync(self, db: Session) -> None:
+        if time.monotonic() - self._last_sync < self.sync_seconds:
+            return
+
+        try:
+            rows = crud.RevokedTokenCRUD.get_active_since(db, self._last_id)
+        except Exception as e:
+            # keep serving from the current filter; retry on the next interval
+            print(f"Revocation list sync failed: {e}")
+            db.rollback()
+            self._last_sync = time.monotonic()
+            return
+
+        with self._lock:
+            for row_id, jti in rows:
+                if jti not in self._filter:
+                    self._filter.add(jti)
+                self._last_id = max(self._last_id, row_id)
+            self._last_sync = time.monotonic()
+            needs_rebuild = self._filter.count > self._filter.capacity
+
+        if needs_rebuild:
+            self.load(db)
+
+    def is_revoked(self, db: Session, jti: str) -> bool:
+        self._sync(db)
+        if jti not in self._filter:
+            return False
+        return crud.RevokedTokenCRUD.is_revoked(db, jti)
+
+    def revoke(self, db: Session, jti: str, token_type: str, expires_at) -> bool:
+        """Persist a revocation; False if the jti was already revoked"""
+        revoked = crud.RevokedTokenCRUD.revoke(db, jti, token_type, expires_at)
+        with self._lock:
+            if jti not in self._filter:
+                self._filter.add(jti)
+        return revoked
+
+
+revocation_list = RevocationList()
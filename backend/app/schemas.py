@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr, field_validator
-from typing import Optional, List
+from typing import Optional, List, Literal
 from datetime import datetime
 from .models import PetSize, PetType, AdoptionStatus, ActivityLevel, HouseType, UserRole
 import enum
@@ -77,6 +77,7 @@ class Pet(PetBase):
     created_at: datetime
     updated_at: Optional[datetime] = None
     match_score: Optional[float] = None
+    favorite_count: int = 0
     
     class Config:
         from_attributes = True
@@ -101,6 +102,30 @@ class PetWithContact(Pet):
     shelter: ShelterContact
 
 
+class PetDetail(PetWithContact):
+    favorites_count: int = 0
+    is_favorited: bool = False
+
+
+class PetBatchRequest(BaseModel):
+    ids: List[int]
+    include_contact: bool = False
+
+
+class PetBulkStatusUpdate(BaseModel):
+    pet_ids: List[int]
+    adoption_status: AdoptionStatus
+
+
+class FavoriteOperation(BaseModel):
+    pet_id: int
+    action: Literal["add", "remove"]
+
+
+class FavoriteSyncRequest(BaseModel):
+    operations: List[FavoriteOperation]
+
+
 class LoginRequest(BaseModel):
     
     email: EmailStr
@@ -120,10 +145,13 @@ class PetSummary(BaseModel):
     adoption_fee: float
     primary_photo_url: Optional[str] = None
     shelter_id: int
+    favorite_count: int = 0
     
   
     completeness_score: Optional[float] = None
     completeness_level: Optional[ProfileCompleteness] = None
+    # Only set when the request carries an adopter's token
+    is_favorited: Optional[bool] = None
     
     class Config:
         from_attributes = True
@@ -279,6 +307,17 @@ class TokenResponse(BaseModel):
     access_token: str
     token_type: str
     user: User
+    refresh_token: Optional[str] = None
+
+
+class RefreshRequest(BaseModel):
+    
+    refresh_token: str
+
+
+class LogoutRequest(BaseModel):
+    
+    refresh_token: Optional[str] = None
 
 
 class UserProfileCompleteness(BaseModel):
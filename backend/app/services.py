@@ -1,7 +1,27 @@
+from sqlalchemy import and_, case, false, true
 from sqlalchemy.orm import Session
-from typing import Optional, List, Dict
-from . import models, schemas, crud, auth
+from fastapi.encoders import jsonable_encoder
+from typing import Optional, List, Dict, Iterator, Tuple
+from collections import defaultdict
+from pydantic import ValidationError
+from . import models, schemas, crud, auth, cache
+from .favorite_counts import favorite_counts
+import base64
+import csv
+import io
 import json
+import math
+from datetime import datetime
+
+def rehash_password(db: Session, account, new_hash: str, user_type: str) -> None:
+    """Store an upgraded password hash after a successful login; failures never block the login"""
+    try:
+        account.hashed_password = new_hash
+        db.commit()
+        cache.invalidate_principal(user_type, account.id)
+    except Exception as e:
+        print(f"Password rehash failed: {e}")
+        db.rollback()
 
 class UserService:
 
@@ -11,12 +31,11 @@ class UserService:
         
         
         email_lower = user_data.email.lower().strip()
-        existing_user = crud.UserCRUD.get_user_by_email(db, email_lower)
-        existing_shelter = crud.ShelterCRUD.get_shelter_by_email(db, email_lower)
+        existing_account = crud.AccountCRUD.find_account_by_email(db, email_lower)
         
-        if existing_user:
+        if existing_account and existing_account.account_type == "user":
             raise ValueError("This email is already registered as an adopter account. Please use a different email or try logging in instead.")
-        if existing_shelter:
+        if existing_account:
             raise ValueError("This email is already registered as a shelter account. Please use a different email or log in to your shelter account.")
         
         hashed_password = auth.hash_password(user_data.password)
@@ -73,48 +92,52 @@ class UserService:
             update_data['preferred_temperament'] = json.dumps(preferences.preferred_temperament)
         
         
+        # The flags are computed by the same UPDATE from the row's new values
+        update_data.update(UserService.completeness_flag_expressions(update_data))
         updated_user = crud.UserCRUD.update_user(db, user_id, update_data)
         
         if not updated_user:
             raise ValueError("User not found")
         
-        
-        completeness_data = UserService.calculate_completeness_flags(updated_user)
-        
-        
-        final_user = crud.UserCRUD.update_user(db, user_id, completeness_data)
-        return final_user
+        return updated_user
+    
+    BASIC_PREFERENCE_FIELDS = ('preferred_pet_type', 'activity_level', 'house_type', 'has_children')
+    EXTENDED_PREFERENCE_FIELDS = (
+        'preferred_pet_size', 'experience_level', 'has_yard', 'has_other_pets',
+        'max_adoption_fee', 'city', 'state'
+    )
+    EXTENDED_COMPLETE_RATIO = 0.7
     
     @staticmethod
     def calculate_completeness_flags(user: models.User) -> Dict[str, bool]:
         """Calculate profile completeness flags"""
         
+        basic_complete = all(getattr(user, field) is not None for field in UserService.BASIC_PREFERENCE_FIELDS)
         
-        basic_complete = all([
-            user.preferred_pet_type is not None,
-            user.activity_level is not None,
-            user.house_type is not None,
-            user.has_children is not None
-        ])
-        
+        completed_extended = sum(1 for field in UserService.EXTENDED_PREFERENCE_FIELDS if getattr(user, field) is not None)
+        extended_complete = (completed_extended / len(UserService.EXTENDED_PREFERENCE_FIELDS)) >= UserService.EXTENDED_COMPLETE_RATIO
         
-        extended_fields = [
-            user.preferred_pet_size,
-            user.experience_level,
-            user.has_yard,
-            user.has_other_pets,
-            user.max_adoption_fee,
-            user.city,
-            user.state
-        ]
+        return {
+            'basic_preferences_complete': basic_complete,
+            'extended_preferences_complete': extended_complete
+        }
+    
+    @staticmethod
+    def completeness_flag_expressions(update_data: dict) -> Dict:
+        """calculate_completeness_flags as SQL over the user row, for the SET clause of an UPDATE that also writes update_data"""
         
+        def is_set(field):
+            if field in update_data:
+                return true() if update_data[field] is not None else false()
+            return getattr(models.User, field).isnot(None)
         
-        completed_extended = sum(1 for field in extended_fields if field is not None)
-        extended_complete = (completed_extended / len(extended_fields)) >= 0.7
+        extended = UserService.EXTENDED_PREFERENCE_FIELDS
+        needed = math.ceil(len(extended) * UserService.EXTENDED_COMPLETE_RATIO)
+        completed_extended = sum(case((is_set(field), 1), else_=0) for field in extended)
         
         return {
-            'basic_preferences_complete': basic_complete,
-            'extended_preferences_complete': extended_complete
+            'basic_preferences_complete': and_(*(is_set(field) for field in UserService.BASIC_PREFERENCE_FIELDS)),
+            'extended_preferences_complete': completed_extended >= needed
         }
     
     @staticmethod
@@ -128,6 +151,11 @@ class UserService:
         if not user:
             raise ValueError("User not found")
         
+        return UserService.build_profile_completeness(user)
+    
+    @staticmethod
+    def build_profile_completeness(user: models.User) -> schemas.UserProfileCompleteness:
+        """Profile completeness analysis for an already loaded user"""
         
         basic_fields = {
             'preferred_pet_type': user.preferred_pet_type,
@@ -164,6 +192,25 @@ class UserService:
             missing_extended_fields=missing_extended
         )
     
+    @staticmethod
+    def get_dashboard(db: Session, user: models.User, matches_limit: int = 20, favorites_limit: int = 20) -> Dict:
+        """Everything the adopter dashboard needs, from one loaded user and one session"""
+        completeness_flags = UserService.calculate_completeness_flags(user)
+        
+        favorites = crud.UserFavoriteCRUD.get_user_favorites(db, user.id, 0, favorites_limit)
+        favorites_total = crud.UserFavoriteCRUD.get_user_favorites_count(db, user.id)
+        
+        return {
+            "profile_completeness": UserService.build_profile_completeness(user),
+            "matches": MatchingService.build_matches_response(db, user, matches_limit, completeness_flags),
+            "favorites": {
+                "favorites": [schemas.PetSummary.from_orm(pet) for pet in favorites],
+                "total": favorites_total,
+                "page": 1,
+                "size": favorites_limit
+            }
+        }
+    
     @staticmethod
     def authenticate_user(db: Session, email: str, password: str) -> Optional[models.User]:
         email_lower = email.lower().strip()
@@ -171,8 +218,12 @@ class UserService:
         if not user:
             return None
             
-        if not auth.verify_password(password, user.hashed_password):
+        verified, new_hash = auth.verify_and_update_password(password, user.hashed_password)
+        if not verified:
             return None
+        
+        if new_hash:
+            rehash_password(db, user, new_hash, "user")
             
         return user
     
@@ -188,6 +239,52 @@ class UserService:
         }
         return auth.create_access_token(token_data)
 
+class FavoriteService:
+    
+    MAX_SYNC_OPERATIONS = 500
+    
+    @staticmethod
+    def mark_favorites(db: Session, user_id: int, pet_summaries: List[schemas.PetSummary]) -> None:
+        """Set is_favorited on a page of pets with one pet_id IN (...) query"""
+        favorited = crud.UserFavoriteCRUD.get_favorited_pet_ids(db, user_id, [summary.id for summary in pet_summaries])
+        for summary in pet_summaries:
+            summary.is_favorited = summary.id in favorited
+    
+    @staticmethod
+    def sync_favorites(db: Session, user_id: int, operations: List[schemas.FavoriteOperation]) -> Dict:
+        """
+        Apply a queue of favorite toggles in one transaction. Operations are
+        replayed in order, so the last one for each pet wins.
+        """
+        if len(operations) > FavoriteService.MAX_SYNC_OPERATIONS:
+            raise ValueError(f"Too many operations (maximum {FavoriteService.MAX_SYNC_OPERATIONS} per request)")
+        
+        final_actions = {}
+        for operation in operations:
+            final_actions[operation.pet_id] = operation.action
+        
+        add_ids = [pet_id for pet_id, action in final_actions.items() if action == "add"]
+        remove_ids = [pet_id for pet_id, action in final_actions.items() if action == "remove"]
+        
+        favorite_counts.touch()
+        added, removed = crud.UserFavoriteCRUD.sync_favorites(db, user_id, add_ids, remove_ids)
+        favorite_counts.record(added, 1)
+        favorite_counts.record(removed, -1)
+        for pet_id in added + removed:
+            cache.invalidate_pet(pet_id)
+        
+        # An add that inserted nothing was either already a favorite or names a missing pet
+        not_added = [pet_id for pet_id in add_ids if pet_id not in set(added)]
+        already_favorited = crud.UserFavoriteCRUD.get_favorited_pet_ids(db, user_id, not_added)
+        
+        return {
+            "added": added,
+            "removed": removed,
+            "unchanged": [pet_id for pet_id in final_actions
+                          if pet_id in already_favorited or (final_actions[pet_id] == "remove" and pet_id not in removed)],
+            "not_found": [pet_id for pet_id in not_added if pet_id not in already_favorited]
+        }
+
 class PetService:
     
     @staticmethod
@@ -209,9 +306,37 @@ class PetService:
         return result
     
     @staticmethod
-    def get_pets_formatted_for_api(db: Session, include_completeness: bool = False, **filters):
+    def parse_fields(fields: Optional[str], schema) -> Optional[List[str]]:
+        """Parse a comma separated `fields=` value and validate it against a response schema"""
+        if not fields:
+            return None
+        
+        requested = []
+        for field in fields.split(","):
+            field = field.strip()
+            if field and field not in requested:
+                requested.append(field)
+        
+        unknown = [field for field in requested if field not in schema.model_fields]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(schema.model_fields)}")
+        
+        return requested or None
+    
+    @staticmethod
+    def select_fields(data, fields: List[str]) -> Dict:
+        """Build a sparse payload holding only the requested fields"""
+        if isinstance(data, dict):
+            return {field: data.get(field) for field in fields}
+        return {field: getattr(data, field, None) for field in fields}
+    
+    @staticmethod
+    def get_pets_formatted_for_api(db: Session, include_completeness: bool = False, fields: Optional[List[str]] = None,
+                                   favorites_user_id: Optional[int] = None, **filters):
+        """Listing payload; with favorites_user_id each pet also says whether that adopter favorited it"""
         
         if include_completeness:
+            # Completeness looks at every column, so no column pushdown here
             pets_with_completeness = PetService.get_pets_with_completeness(db, **filters)
             
             pet_summaries = []
@@ -222,21 +347,159 @@ class PetService:
                 summary.completeness_score = item["completeness_score"]
                 pet_summaries.append(summary)
             
+            if favorites_user_id is not None:
+                FavoriteService.mark_favorites(db, favorites_user_id, pet_summaries)
+            if fields:
+                return [PetService.select_fields(summary, fields) for summary in pet_summaries]
             return pet_summaries
+        elif fields:
+            pets = crud.PetCRUD.get_pets(db, fields=fields, **filters)
+            results = [PetService.select_fields(pet, fields) for pet in pets]
+            if favorites_user_id is not None and "is_favorited" in fields:
+                favorited = crud.UserFavoriteCRUD.get_favorited_pet_ids(db, favorites_user_id, [pet.id for pet in pets])
+                for pet, result in zip(pets, results):
+                    result["is_favorited"] = pet.id in favorited
+            return results
         else:
             pets = crud.PetCRUD.get_pets(db, **filters)
             pet_summaries = [schemas.PetSummary.from_orm(pet) for pet in pets]
+            if favorites_user_id is not None:
+                FavoriteService.mark_favorites(db, favorites_user_id, pet_summaries)
             return pet_summaries
     
+    EXPORT_FORMATS = ("ndjson", "csv")
+
+    @staticmethod
+    def export_pets(db: Session, export_format: str = "ndjson", batch_size: int = 500, **filters) -> Iterator[str]:
+        """Yield the whole filtered catalog as NDJSON lines or CSV rows"""
+        columns = [column.name for column in models.Pet.__table__.columns]
+
+        if export_format == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(columns)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            for row in crud.PetCRUD.iter_pets(db, batch_size=batch_size, **filters):
+                writer.writerow(jsonable_encoder([row[column] for column in columns]))
+                if buffer.tell() >= 64 * 1024:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+            yield buffer.getvalue()
+        else:
+            for row in crud.PetCRUD.iter_pets(db, batch_size=batch_size, **filters):
+                yield json.dumps(jsonable_encoder(dict(row))) + "\n"
+
     @staticmethod
-    def get_pet_by_id(db: Session, pet_id: int) -> models.Pet:
-        pet = crud.PetCRUD.get_pet(db, pet_id)
+    def get_pet_by_id(db: Session, pet_id: int, fields: Optional[List[str]] = None) -> models.Pet:
+        pet = crud.PetCRUD.get_pet(db, pet_id, fields=fields)
         if not pet:
             raise ValueError("Pet not found")
         
         
         return pet
     
+    MAX_BATCH_SIZE = 100
+    
+    @staticmethod
+    def get_pets_batch(db: Session, pet_ids: List[int], include_contact: bool = False,
+                       fields: Optional[List[str]] = None) -> Dict:
+        """Fetch many pets in one query, keeping the requested order and reporting missing ids"""
+        unique_ids = list(dict.fromkeys(pet_ids))
+        if not unique_ids:
+            raise ValueError("At least one pet id is required")
+        if len(unique_ids) > PetService.MAX_BATCH_SIZE:
+            raise ValueError(f"Too many pet ids (maximum {PetService.MAX_BATCH_SIZE})")
+        
+        pets = crud.PetCRUD.get_pets_by_ids(db, unique_ids, include_shelter=include_contact, fields=fields)
+        pets_by_id = {pet.id: pet for pet in pets}
+        schema = schemas.PetWithContact if include_contact else schemas.Pet
+        
+        results = []
+        missing_ids = []
+        for pet_id in unique_ids:
+            pet = pets_by_id.get(pet_id)
+            if pet is None:
+                missing_ids.append(pet_id)
+            elif fields:
+                data = PetService.select_fields(pet, fields)
+                if "shelter" in data:
+                    data["shelter"] = schemas.ShelterContact.from_orm(pet.shelter)
+                results.append(data)
+            else:
+                results.append(schema.from_orm(pet))
+        
+        return {"pets": results, "missing_ids": missing_ids}
+    
+    MAX_INVENTORY_PAGE = 100
+    
+    @staticmethod
+    def _encode_cursor(sort: str, value, pet_id: int) -> str:
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        payload = json.dumps({"sort": sort, "value": value, "id": pet_id}, separators=(",", ":"))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+    
+    @staticmethod
+    def _decode_cursor(cursor: str, sort: str) -> tuple:
+        try:
+            padded = cursor + "=" * (-len(cursor) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            value, pet_id = payload["value"], int(payload["id"])
+        except Exception:
+            raise ValueError("Invalid cursor")
+        
+        if payload.get("sort") != sort:
+            raise ValueError("Cursor does not match the requested sort")
+        if crud.PetCRUD.INVENTORY_SORTS[sort][0] == "created_at" and value is not None:
+            value = datetime.fromisoformat(value)
+        return value, pet_id
+    
+    @staticmethod
+    def get_shelter_inventory(db: Session, shelter_id: int, adoption_status: Optional[str] = None,
+                              sort: str = "newest", limit: int = 20, cursor: Optional[str] = None,
+                              fields: Optional[List[str]] = None) -> Dict:
+        """A page of a shelter's pets plus per-status counts; pass next_cursor back to get the next page"""
+        if sort not in crud.PetCRUD.INVENTORY_SORTS:
+            raise ValueError(f"Invalid sort. Use: {', '.join(crud.PetCRUD.INVENTORY_SORTS)}")
+        if not 1 <= limit <= PetService.MAX_INVENTORY_PAGE:
+            raise ValueError(f"limit must be between 1 and {PetService.MAX_INVENTORY_PAGE}")
+        
+        status_enum = None
+        if adoption_status:
+            try:
+                status_enum = models.AdoptionStatus(adoption_status.lower())
+            except ValueError:
+                raise ValueError(f"Invalid status. Use: {', '.join(status.value for status in models.AdoptionStatus)}")
+        
+        after = PetService._decode_cursor(cursor, sort) if cursor else None
+        
+        pets = crud.PetCRUD.get_shelter_inventory(
+            db, shelter_id, adoption_status=status_enum, sort=sort,
+            limit=limit + 1, after=after, fields=fields
+        )
+        has_more = len(pets) > limit
+        pets = pets[:limit]
+        
+        next_cursor = None
+        if has_more:
+            last = pets[-1]
+            sort_column = crud.PetCRUD.INVENTORY_SORTS[sort][0]
+            next_cursor = PetService._encode_cursor(sort, getattr(last, sort_column), last.id)
+        
+        if fields:
+            results = [PetService.select_fields(pet, fields) for pet in pets]
+        else:
+            results = [schemas.Pet.from_orm(pet) for pet in pets]
+        
+        return {
+            "pets": results,
+            "next_cursor": next_cursor,
+            "counts": crud.ShelterPetCounterCRUD.get_counts(db, shelter_id)
+        }
+    
     @staticmethod
     def get_pet_with_contact(db: Session, pet_id: int) -> models.Pet:
         """Get pet with shelter contact information"""
@@ -246,6 +509,30 @@ class PetService:
         
         return pet
     
+    @staticmethod
+    def get_pet_detail(db: Session, pet_id: int, user_id: Optional[int] = None) -> schemas.PetDetail:
+        """Pet, shelter contact, popularity and the viewer's favorite state"""
+        result = crud.PetCRUD.get_pet_detail(db, pet_id, user_id)
+        if not result:
+            raise ValueError("Pet not found")
+        
+        pet, favorites_count, is_favorited = result
+        detail = schemas.PetDetail.from_orm(pet)
+        # include this worker's favorites that the write-behind flush has not stored yet
+        detail.favorites_count = max(favorites_count + favorite_counts.pending(pet_id), 0)
+        detail.favorite_count = detail.favorites_count
+        detail.is_favorited = is_favorited
+        return detail
+    
+    @staticmethod
+    def get_public_pet_detail(db: Session, pet_id: int) -> Dict:
+        """Anonymous pet detail payload, served from a short-lived cache"""
+        payload = cache.pet_detail_cache.get(pet_id)
+        if payload is None:
+            payload = jsonable_encoder(PetService.get_pet_detail(db, pet_id))
+            cache.pet_detail_cache.set(pet_id, payload)
+        return payload
+    
     @staticmethod
     def _validate_pet_data(age_years=None, adoption_fee=None, temperament=None):
         if age_years is not None:
@@ -275,16 +562,38 @@ class PetService:
     @staticmethod
     def update_pet(db: Session, pet_id: int, update_data: schemas.PetUpdate) -> models.Pet:
         
-        existing_pet = crud.PetCRUD.get_pet(db, pet_id)
-        if not existing_pet:
-            raise ValueError("Pet not found")
-        
         PetService._validate_pet_data(update_data.age_years, update_data.adoption_fee, update_data.temperament)
         
-
         updated_pet = crud.PetCRUD.update_pet(db, pet_id, update_data)
+        if not updated_pet:
+            raise ValueError("Pet not found")
+        cache.invalidate_pet(pet_id)
         return updated_pet
     
+    MAX_BULK_UPDATE = 500
+    
+    @staticmethod
+    def bulk_update_status(db: Session, shelter_id: int, pet_ids: List[int],
+                           adoption_status: models.AdoptionStatus) -> Dict:
+        """Change the adoption status of many of a shelter's pets at once"""
+        unique_ids = list(dict.fromkeys(pet_ids))
+        if not unique_ids:
+            raise ValueError("pet_ids must not be empty")
+        if len(unique_ids) > PetService.MAX_BULK_UPDATE:
+            raise ValueError(f"Too many pets (maximum {PetService.MAX_BULK_UPDATE} per request)")
+        
+        updated_ids, unchanged_ids = crud.PetCRUD.bulk_update_status(db, shelter_id, unique_ids, adoption_status)
+        for pet_id in updated_ids:
+            cache.invalidate_pet(pet_id)
+        
+        found = set(updated_ids) | set(unchanged_ids)
+        return {
+            "adoption_status": adoption_status.value,
+            "updated_ids": sorted(updated_ids),
+            "unchanged_ids": sorted(unchanged_ids),
+            "not_found_ids": [pet_id for pet_id in unique_ids if pet_id not in found]
+        }
+    
     @staticmethod
     def delete_pet(db: Session, pet_id: int) -> dict:
         
@@ -296,6 +605,7 @@ class PetService:
         success = crud.PetCRUD.delete_pet(db, pet_id)
         if not success:
             raise Exception("Failed to delete pet")  
+        cache.invalidate_pet(pet_id)
         
         return {"message": "Pet deleted successfully"}
     
@@ -341,10 +651,12 @@ class PetService:
 class MatchingService:
     
     @staticmethod
-    def calculate_user_pet_compatibility(user: models.User, pet: models.Pet) -> float:
+    def calculate_user_pet_compatibility(user: models.User, pet: models.Pet,
+                                         completeness_flags: Optional[Dict[str, bool]] = None) -> float:
         """Calculate compatibility score between user and pet"""
         
-        completeness_flags = UserService.calculate_completeness_flags(user)
+        if completeness_flags is None:
+            completeness_flags = UserService.calculate_completeness_flags(user)
         
         if not completeness_flags['basic_preferences_complete']:
             return 0.0
@@ -390,7 +702,16 @@ class MatchingService:
         if not user:
             return []
         
-        if not UserService.calculate_completeness_flags(user)['basic_preferences_complete']:
+        return MatchingService.get_matches_for_user(db, user, limit)
+    
+    @staticmethod
+    def get_matches_for_user(db: Session, user: models.User, limit: int = 20,
+                             completeness_flags: Optional[Dict[str, bool]] = None) -> List[Dict]:
+        
+        if completeness_flags is None:
+            completeness_flags = UserService.calculate_completeness_flags(user)
+        
+        if not completeness_flags['basic_preferences_complete']:
             return []
 
         pets = crud.PetCRUD.get_pets(
@@ -401,7 +722,7 @@ class MatchingService:
         
         matches = []
         for pet in pets:
-            compatibility = MatchingService.calculate_user_pet_compatibility(user, pet)
+            compatibility = MatchingService.calculate_user_pet_compatibility(user, pet, completeness_flags)
             if compatibility > 30: 
                 pet_summary = schemas.PetSummary.from_orm(pet)
                 matches.append({
@@ -410,8 +731,10 @@ class MatchingService:
                 })
         
         matches.sort(key=lambda x: x['compatibility_score'], reverse=True)
+        matches = matches[:limit]
+        FavoriteService.mark_favorites(db, user.id, [match["pet"] for match in matches])
         
-        return matches[:limit]
+        return matches
     
     @staticmethod
     def get_user_matches_with_validation(db: Session, user_id: int, limit: int):
@@ -420,7 +743,14 @@ class MatchingService:
         if not user:
             raise ValueError("User not found")
         
-        completeness_flags = UserService.calculate_completeness_flags(user)
+        return MatchingService.build_matches_response(db, user, limit)
+    
+    @staticmethod
+    def build_matches_response(db: Session, user: models.User, limit: int,
+                               completeness_flags: Optional[Dict[str, bool]] = None) -> Dict:
+        
+        if completeness_flags is None:
+            completeness_flags = UserService.calculate_completeness_flags(user)
         if not completeness_flags['basic_preferences_complete']:
             return {
                 "message": "Please complete your basic preferences to get matches",
@@ -428,7 +758,7 @@ class MatchingService:
                 "requires_preferences": True
             }
         
-        matches = MatchingService.get_user_matches(db, user_id, limit)
+        matches = MatchingService.get_matches_for_user(db, user, limit, completeness_flags)
         return {
             "matches": matches,
             "total": len(matches),
@@ -445,12 +775,11 @@ class ShelterService:
     @staticmethod
     def register_shelter(db: Session, shelter_data: schemas.ShelterRegister) -> models.Shelter:
         email_lower = shelter_data.email.lower().strip()
-        existing_user = crud.UserCRUD.get_user_by_email(db, email_lower)
-        existing_shelter = crud.ShelterCRUD.get_shelter_by_email(db, email_lower)
+        existing_account = crud.AccountCRUD.find_account_by_email(db, email_lower)
         
-        if existing_user:
+        if existing_account and existing_account.account_type == "user":
             raise ValueError("This email is already registered as an adopter account. Please use a different email or log in to your adopter account.")
-        if existing_shelter:
+        if existing_account:
             raise ValueError("This email is already registered as a shelter account. Please use a different email or try logging in instead.")
         
         hashed_password = auth.hash_password(shelter_data.password)
@@ -463,6 +792,8 @@ class ShelterService:
         
         db_shelter = models.Shelter(**shelter_dict)
         db.add(db_shelter)
+        db.flush()
+        crud.ShelterPetCounterCRUD.ensure(db, db_shelter.id)
         db.commit()
         db.refresh(db_shelter)
         
@@ -476,8 +807,12 @@ class ShelterService:
         if not shelter:
             return None
             
-        if not auth.verify_password(password, shelter.hashed_password):
+        verified, new_hash = auth.verify_and_update_password(password, shelter.hashed_password)
+        if not verified:
             return None
+        
+        if new_hash:
+            rehash_password(db, shelter, new_hash, "shelter")
             
         return shelter
     
@@ -493,9 +828,70 @@ class ShelterService:
         return auth.create_access_token(token_data)
 
 
+class AccountService:
+    
+    @staticmethod
+    def authenticate(db: Session, email: str, password: str):
+        """Log in an adopter or a shelter from the email alone.
+
+        Returns (account_type, account) or None. The account type is resolved
+        with one indexed lookup, so only the matching table is read.
+        """
+        account = crud.AccountCRUD.find_account_by_email(db, email)
+        if not account:
+            return None
+        
+        if account.account_type == "shelter":
+            record = crud.ShelterCRUD.get_shelter(db, account.account_id)
+        else:
+            record = crud.UserCRUD.get_user(db, account.account_id)
+        
+        verified, new_hash = auth.verify_and_update_password(password, record.hashed_password)
+        if not verified:
+            return None
+        
+        if new_hash:
+            rehash_password(db, record, new_hash, account.account_type)
+        
+        return account.account_type, record
+    
+    @staticmethod
+    def create_refresh_token(account_type: str, account) -> str:
+        return auth.create_refresh_token(account.id, account_type)
+    
+    @staticmethod
+    def rotate_refresh_token(db: Session, refresh_token: str):
+        """Spend a refresh token and return (account_type, account) to issue a new pair for.
+
+        Each refresh token works once: its jti is revoked here, and presenting it
+        again raises ValueError, as does a token whose account no longer exists.
+        A deactivated or suspended account raises PermissionError.
+        """
+        payload = auth.decode_refresh_token(refresh_token)
+        if not auth.revoke_token(db, payload):
+            raise ValueError("Refresh token has already been used")
+        
+        account_type = "shelter" if payload.get("user_type") == "shelter" else "user"
+        if account_type == "shelter":
+            record = crud.ShelterCRUD.get_shelter(db, payload.get("user_id"))
+        else:
+            record = crud.UserCRUD.get_user(db, payload.get("user_id"))
+        
+        if not record:
+            raise ValueError("Account not found")
+        if not record.is_active:
+            raise PermissionError("Account suspended")
+        
+        return account_type, record
+
+
 class DuplicateDetectionService:
     """Service to detect potential duplicate pet listings"""
     
+    # A new pet is refused outright once this many pets score HIGH_SIMILARITY or more
+    HIGH_SIMILARITY = 90.0
+    HIGH_SIMILARITY_LIMIT = 3
+    
     @staticmethod
     def calculate_pet_similarity(pet1: dict, pet2: dict) -> float:
         """Calculate similarity score between two pets (0-100%)"""
@@ -504,17 +900,17 @@ class DuplicateDetectionService:
         
         
         name_weight = 30.0
-        if pet1.get('name', '').lower() == pet2.get('name', '').lower():
+        if (pet1.get('name') or '').lower() == (pet2.get('name') or '').lower():
             similarity_score += name_weight
-        elif DuplicateDetectionService._fuzzy_match(pet1.get('name', ''), pet2.get('name', '')):
+        elif DuplicateDetectionService._fuzzy_match(pet1.get('name'), pet2.get('name')):
             similarity_score += name_weight * 0.7
         total_weight += name_weight
         
         
         breed_weight = 25.0
-        if pet1.get('breed', '').lower() == pet2.get('breed', '').lower():
+        if (pet1.get('breed') or '').lower() == (pet2.get('breed') or '').lower():
             similarity_score += breed_weight
-        elif DuplicateDetectionService._fuzzy_match(pet1.get('breed', ''), pet2.get('breed', '')):
+        elif DuplicateDetectionService._fuzzy_match(pet1.get('breed'), pet2.get('breed')):
             similarity_score += breed_weight * 0.6
         total_weight += breed_weight
         
@@ -535,15 +931,15 @@ class DuplicateDetectionService:
         
         
         color_weight = 10.0
-        if pet1.get('color', '').lower() == pet2.get('color', '').lower():
+        if (pet1.get('color') or '').lower() == (pet2.get('color') or '').lower():
             similarity_score += color_weight
-        elif DuplicateDetectionService._fuzzy_match(pet1.get('color', ''), pet2.get('color', '')):
+        elif DuplicateDetectionService._fuzzy_match(pet1.get('color'), pet2.get('color')):
             similarity_score += color_weight * 0.5
         total_weight += color_weight
         
         
         gender_weight = 5.0
-        if pet1.get('gender', '').lower() == pet2.get('gender', '').lower():
+        if (pet1.get('gender') or '').lower() == (pet2.get('gender') or '').lower():
             similarity_score += gender_weight
         total_weight += gender_weight
         
@@ -608,13 +1004,13 @@ class DuplicateDetectionService:
                     'similarity_score': round(similarity, 1)
                 })
                 
-                if similarity >= 90.0:
+                if similarity >= DuplicateDetectionService.HIGH_SIMILARITY:
                     high_similarity_count += 1
                     
             max_similarity = max(max_similarity, similarity)
         
-        HIGH_SIMILARITY_LIMIT = 3
-        limit_exceeded = high_similarity_count >= HIGH_SIMILARITY_LIMIT and max_similarity >= 90.0
+        HIGH_SIMILARITY_LIMIT = DuplicateDetectionService.HIGH_SIMILARITY_LIMIT
+        limit_exceeded = high_similarity_count >= HIGH_SIMILARITY_LIMIT and max_similarity >= DuplicateDetectionService.HIGH_SIMILARITY
         
         return {
             'is_duplicate': len(similar_pets) > 0,
@@ -623,4 +1019,190 @@ class DuplicateDetectionService:
             'high_similarity_count': high_similarity_count,
             'limit_exceeded': limit_exceeded,
             'similarity_limit': HIGH_SIMILARITY_LIMIT
-        }
\ No newline at end of file
+        }
+    
+    @staticmethod
+    def _similarity_fields(pet) -> dict:
+        """The fields calculate_pet_similarity compares, from a Pet or a PetCreate"""
+        return {
+            'name': pet.name or '',
+            'breed': pet.breed or '',
+            'age_years': pet.age_years,
+            'age_months': pet.age_months,
+            'size': pet.size.value if pet.size else None,
+            'color': pet.color or '',
+            'gender': pet.gender or ''
+        }
+    
+    @staticmethod
+    def check_batch_for_duplicates(db: Session, shelter_id: int, new_pets: List[Tuple[int, schemas.PetCreate]],
+                                   threshold: float = 85.0) -> Dict[int, dict]:
+        """
+        Duplicate check for a whole import: {row: {"similar_pets", "high_similarity_count", "limit_exceeded"}}
+        for every row that resembles an available pet of the shelter or an earlier row of the same batch,
+        with the same high-similarity limit as check_for_duplicates.
+        Above 81% a pet must share the breed, or have a similar breed and the same name, and be within
+        6 months of age, so rows are only compared inside their breed and name buckets, filled by one query.
+        """
+        bucketed = threshold > 81.0
+        rows = [(row, pet, DuplicateDetectionService._similarity_fields(pet)) for row, pet in new_pets]
+        by_breed, by_name, everything = defaultdict(list), defaultdict(list), []
+        
+        def remember(fields: dict, reference: dict):
+            entry = (fields, reference)
+            everything.append(entry)
+            by_breed[fields['breed'].lower()].append(entry)
+            by_name[fields['name'].lower()].append(entry)
+        
+        if bucketed:
+            existing_pets = crud.PetCRUD.get_duplicate_candidates(
+                db, shelter_id,
+                breeds=sorted({fields['breed'].lower() for _, _, fields in rows}),
+                names=sorted({fields['name'].lower() for _, _, fields in rows})
+            )
+        else:
+            existing_pets = crud.PetCRUD.get_pets_by_shelter(db=db, shelter_id=shelter_id, adoption_status="available")
+        for existing_pet in existing_pets:
+            remember(DuplicateDetectionService._similarity_fields(existing_pet),
+                     {'pet_id': existing_pet.id, 'name': existing_pet.name})
+        
+        duplicates = {}
+        for row, pet, fields in rows:
+            if bucketed:
+                breed, name = fields['breed'].lower(), fields['name'].lower()
+                age = (fields['age_years'] or 0) * 12 + (fields['age_months'] or 0)
+                candidates = [
+                    entry for entry in by_breed[breed] + [entry for entry in by_name[name] if entry[0]['breed'].lower() != breed]
+                    if abs((entry[0]['age_years'] or 0) * 12 + (entry[0]['age_months'] or 0) - age) <= 6
+                ]
+            else:
+                candidates = everything
+            
+            similar = []
+            high_similarity_count = 0
+            for other_fields, reference in candidates:
+                similarity = DuplicateDetectionService.calculate_pet_similarity(fields, other_fields)
+                if similarity >= threshold:
+                    similar.append({**reference, 'similarity_score': round(similarity, 1)})
+                    if similarity >= DuplicateDetectionService.HIGH_SIMILARITY:
+                        high_similarity_count += 1
+            
+            if similar:
+                duplicates[row] = {
+                    'similar_pets': similar,
+                    'high_similarity_count': high_similarity_count,
+                    'limit_exceeded': high_similarity_count >= DuplicateDetectionService.HIGH_SIMILARITY_LIMIT
+                }
+            else:
+                remember(fields, {'row': row, 'name': pet.name})
+        
+        return duplicates
+
+
+class PetImportService:
+    """Bulk pet import for shelters from CSV, JSON or NDJSON (the formats /pets/export writes)"""
+    
+    FORMATS = ("csv", "json", "ndjson")
+    MAX_ROWS = 5000
+    MAX_BYTES = 10 * 1024 * 1024
+    
+    @staticmethod
+    def detect_format(filename: Optional[str], requested: Optional[str] = None) -> str:
+        import_format = (requested or (filename or "").rsplit(".", 1)[-1]).lower()
+        if import_format == "jsonl":
+            import_format = "ndjson"
+        if import_format not in PetImportService.FORMATS:
+            raise ValueError(f"Unsupported import format. Use: {', '.join(PetImportService.FORMATS)}")
+        return import_format
+    
+    @staticmethod
+    def parse_rows(content: bytes, import_format: str) -> List[dict]:
+        """Decode an upload into one dict per pet; empty CSV cells are left out so schema defaults apply"""
+        try:
+            text = content.decode("utf-8-sig")
+        except UnicodeDecodeError:
+            raise ValueError("File must be UTF-8 encoded")
+        
+        try:
+            if import_format == "csv":
+                rows = [
+                    {key.strip(): value for key, value in record.items() if key and value not in (None, "")}
+                    for record in csv.DictReader(io.StringIO(text))
+                ]
+            elif import_format == "ndjson":
+                rows = [json.loads(line) for line in text.splitlines() if line.strip()]
+            else:
+                data = json.loads(text)
+                rows = data.get("pets") if isinstance(data, dict) else data
+        except (csv.Error, json.JSONDecodeError) as e:
+            raise ValueError(f"Could not parse {import_format.upper()} file: {e}")
+        
+        if not isinstance(rows, list):
+            raise ValueError("JSON imports must be a list of pets or an object with a 'pets' list")
+        if not rows:
+            raise ValueError("The file contains no pets")
+        if len(rows) > PetImportService.MAX_ROWS:
+            raise ValueError(f"Too many rows (maximum {PetImportService.MAX_ROWS} per import)")
+        return rows
+    
+    @staticmethod
+    def import_pets(db: Session, shelter_id: int, content: bytes, import_format: str,
+                    override_duplicate: bool = False) -> Dict:
+        """
+        Validate every row, run one duplicate check for the batch and insert the accepted rows
+        in a single statement. Returns a per-row report; rows are numbered from 1.
+        """
+        rows = PetImportService.parse_rows(content, import_format)
+        
+        report = []
+        valid = []
+        for row, record in enumerate(rows, start=1):
+            if not isinstance(record, dict):
+                report.append({"row": row, "status": "invalid", "errors": ["Row must be an object"]})
+                continue
+            try:
+                pet = schemas.PetCreate(**{**record, "shelter_id": shelter_id})
+                PetService._validate_pet_data(pet.age_years, pet.adoption_fee, pet.temperament)
+            except ValidationError as e:
+                errors = [f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in e.errors()]
+                report.append({"row": row, "status": "invalid", "errors": errors})
+                continue
+            except ValueError as e:
+                report.append({"row": row, "status": "invalid", "errors": [str(e)]})
+                continue
+            
+            entry = {"row": row, "status": "created", "name": pet.name}
+            report.append(entry)
+            valid.append((entry, pet))
+        
+        if not override_duplicate and valid:
+            duplicates = DuplicateDetectionService.check_batch_for_duplicates(
+                db, shelter_id, [(entry["row"], pet) for entry, pet in valid]
+            )
+            for entry, pet in valid:
+                duplicate = duplicates.get(entry["row"])
+                if duplicate is None:
+                    continue
+                if duplicate["limit_exceeded"]:
+                    entry["status"] = "similarity_limit_exceeded"
+                    entry["high_similarity_count"] = duplicate["high_similarity_count"]
+                    entry["similarity_limit"] = DuplicateDetectionService.HIGH_SIMILARITY_LIMIT
+                else:
+                    entry["status"] = "duplicate"
+                entry["similar_pets"] = duplicate["similar_pets"]
+            valid = [(entry, pet) for entry, pet in valid if entry["status"] == "created"]
+        
+        pet_ids = crud.PetCRUD.bulk_create_pets(
+            db, shelter_id, [pet.model_dump(exclude={"shelter_id"}) for _, pet in valid]
+        )
+        for (entry, _), pet_id in zip(valid, pet_ids):
+            entry["pet_id"] = pet_id
+        
+        return {
+            "total_rows": len(rows),
+            "created": len(pet_ids),
+            "duplicates": sum(1 for entry in report if entry["status"] == "duplicate"),
+            "similarity_limit_exceeded": sum(1 for entry in report if entry["status"] == "similarity_limit_exceeded"),
+            "invalid": sum(1 for entry in report if entry["status"] == "invalid"),
+            "rows": report
+        }
@@ -0,0 +1,169 @@
+"""Key/counter store shared by every worker process.
+
+Rate-limit counters, replica stickiness marks and principal-cache
+invalidations all live here, so a write seen by one worker is seen by all.
+RATE_LIMIT_STORAGE_URI names the backend:
+
+  sqlite:///path/to/file.db   a SQLite file on the host (the default)
+  redis://host:6379           anything the `limits` package supports
+"""
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from limits.storage import Storage, MovingWindowSupport, storage_from_string
+
+RATE_LIMIT_STORAGE_URI = os.getenv("RATE_LIMIT_STORAGE_URI", "sqlite:///./rate_limits.db")
+
+
+class SQLiteStorage(Storage, MovingWindowSupport):
+    """`limits` storage backed by a SQLite file, so workers on one host share counters.
+
+    Implements the limits 4+ storage API for the fixed-window and moving-window
+    strategies; sliding-window-counter is not supported. Every check runs in a
+    BEGIN IMMEDIATE transaction, which serialises writers across processes.
+    """
+
+    STORAGE_SCHEME = ["sqlite"]
+    SWEEP_INTERVAL_SECONDS = 60
+
+    def __init__(self, uri: str, wrap_exceptions: bool = False, **options):
+        self.path = uri.split("://", 1)[1][1:] or ":memory:"
+        self.timeout = float(options.get("timeout", 5))
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._last_sweep = 0.0
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        with self._transaction() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_limit_counters "
+                "(key TEXT PRIMARY KEY, value INTEGER NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_limit_events "
+                "(key TEXT NOT NULL, created_at REAL NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_rate_limit_events_key "
+                "ON rate_limit_events (key, created_at)"
+            )
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def close(self) -> None:
+        """Close every thread's connection; threads reconnect on their next call"""
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+            self._local = threading.local()
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _sweep(self, conn: sqlite3.Connection, now: float) -> None:
+        if now - self._last_sweep < self.SWEEP_INTERVAL_SECONDS:
+            return
+        self._last_sweep = now
+        conn.execute("DELETE FROM rate_limit_events WHERE expires_at <= ?", (now,))
+        conn.execute("DELETE FROM rate_limit_counters WHERE expires_at <= ?", (now,))
+
+    def incr(self, key: str, expiry: int, amount: int = 1) -> int:
+        now = time.time()
+        with self._transaction() as conn:
+            self._sweep(conn, now)
+            conn.execute("DELETE FROM rate_limit_counters WHERE key = ? AND expires_at <= ?", (key, now))
+            conn.execute(
+                "INSERT INTO rate_limit_counters (key, value, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET value = value + excluded.value",
+                (key, amount, now + expiry)
+            )
+            return conn.execute("SELECT value FROM rate_limit_counters WHERE key = ?", (key,)).fetchone()[0]
+
+    def get(self, key: str) -> int:
+        row = self._connection().execute(
+            "SELECT value FROM rate_limit_counters WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return row[0] if row else 0
+
+    def get_expiry(self, key: str) -> float:
+        row = self._connection().execute(
+            "SELECT expires_at FROM rate_limit_counters WHERE key = ?", (key,)
+        ).fetchone()
+        return row[0] if row else time.time()
+
+    def check(self) -> bool:
+        try:
+            self._connection().execute("SELECT 1")
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self) -> int:
+        with self._transaction() as conn:
+            count = conn.execute(
+                "SELECT (SELECT COUNT(*) FROM rate_limit_counters) + (SELECT COUNT(DISTINCT key) FROM rate_limit_events)"
+            ).fetchone()[0]
+            conn.execute("DELETE FROM rate_limit_counters")
+            conn.execute("DELETE FROM rate_limit_events")
+        self.close()
+        return count
+
+    def clear(self, key: str) -> None:
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM rate_limit_counters WHERE key = ?", (key,))
+            conn.execute("DELETE FROM rate_limit_events WHERE key = ?", (key,))
+
+    def acquire_entry(self, key: str, limit: int, expiry: int, amount: int = 1) -> bool:
+        if amount > limit:
+            return False
+
+        now = time.time()
+        with self._transaction() as conn:
+            self._sweep(conn, now)
+            conn.execute("DELETE FROM rate_limit_events WHERE key = ? AND created_at <= ?", (key, now - expiry))
+            used = conn.execute("SELECT COUNT(*) FROM rate_limit_events WHERE key = ?", (key,)).fetchone()[0]
+            if used + amount > limit:
+                return False
+            conn.executemany(
+                "INSERT INTO rate_limit_events (key, created_at, expires_at) VALUES (?, ?, ?)",
+                [(key, now, now + expiry)] * amount
+            )
+            return True
+
+    def get_moving_window(self, key: str, limit: int, expiry: int) -> tuple:
+        now = time.time()
+        oldest, count = self._connection().execute(
+            "SELECT MIN(created_at), COUNT(*) FROM rate_limit_events WHERE key = ? AND created_at > ?",
+            (key, now - expiry)
+        ).fetchone()
+        return (oldest, count) if count else (now, 0)
+
+
+shared_store = storage_from_string(RATE_LIMIT_STORAGE_URI)
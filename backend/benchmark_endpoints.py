@@ -0,0 +1,107 @@
+"""Concurrent throughput check for the read endpoints.
+
+Start the API (e.g. `uvicorn app.main:app --workers 1`) and run:
+
+    python benchmark_endpoints.py --base-url http://localhost:8000 --concurrency 100 --requests 2000
+    python benchmark_endpoints.py --path /users/1/matches --token <access token>
+
+Prints requests/second and latency percentiles per path. Run it against the
+sync and async versions of an endpoint with the same settings to compare.
+
+--background keeps a heavy path busy while the others are measured, which
+shows whether it stalls unrelated requests on the same worker:
+
+    python benchmark_endpoints.py --path /pets --background /users/1/matches --token <access token>
+"""
+import argparse
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_PATHS = ["/pets", "/pets?fields=id,name", "/shelters"]
+
+
+def fetch(url: str, token: str = None):
+    request = urllib.request.Request(url)
+    if token:
+        request.add_header("Authorization", f"Bearer {token}")
+
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except Exception:
+        status = None
+    return status, time.perf_counter() - started
+
+
+def percentile(values, pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run(base_url: str, path: str, concurrency: int, total: int, token: str = None):
+    url = base_url.rstrip("/") + path
+    fetch(url, token)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda _: fetch(url, token), range(total)))
+    elapsed = time.perf_counter() - started
+
+    latencies = [latency for status, latency in results if status == 200]
+    failures = len(results) - len(latencies)
+    if not latencies:
+        print(f"{path}: all {total} requests failed")
+        return
+
+    print(
+        f"{path}: {len(latencies) / elapsed:.1f} req/s, "
+        f"p50 {percentile(latencies, 50) * 1000:.1f} ms, "
+        f"p95 {percentile(latencies, 95) * 1000:.1f} ms, "
+        f"p99 {percentile(latencies, 99) * 1000:.1f} ms, "
+        f"{failures} failed"
+    )
+
+
+def hammer(url: str, token: str, stop: threading.Event, completed: list):
+    while not stop.is_set():
+        status, _ = fetch(url, token)
+        if status == 200:
+            completed.append(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--path", action="append", dest="paths", help="Path to benchmark (repeatable)")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--token", help="Bearer token for authenticated paths")
+    parser.add_argument("--background", help="Path requested continuously while the others are measured")
+    parser.add_argument("--background-concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    stop = threading.Event()
+    completed = []
+    if args.background:
+        background_url = args.base_url.rstrip("/") + args.background
+        for _ in range(args.background_concurrency):
+            threading.Thread(target=hammer, args=(background_url, args.token, stop, completed), daemon=True).start()
+        print(f"Background load: {args.background_concurrency} clients on {args.background}")
+
+    print(f"{args.requests} requests per path, {args.concurrency} concurrent, against {args.base_url}")
+    started = time.perf_counter()
+    try:
+        for path in args.paths or DEFAULT_PATHS:
+            run(args.base_url, path, args.concurrency, args.requests, args.token)
+    finally:
+        stop.set()
+    if args.background:
+        print(f"{args.background} (background): {len(completed) / (time.perf_counter() - started):.1f} req/s")
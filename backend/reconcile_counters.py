@@ -0,0 +1,37 @@
+"""
+Script to repair denormalized counters that have drifted from the source rows.
+Run it from cron (one host only) and after writing rows directly, e.g. with
+import_data.py; it is safe while the app is serving traffic.
+
+  shelter_pet_counters  created for shelters without one, reset to the
+                        per-status pet counts where they differ
+  pets.favorite_count   reset to COUNT(*) over user_favorites, skipped if
+                        favorites changed within FAVORITE_COUNT_QUIET_SECONDS
+"""
+import os
+import sys
+from dotenv import load_dotenv
+
+# Add the backend directory to the path so we can import app modules
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+load_dotenv()
+
+from app.database import SessionLocal
+from app.crud import ShelterPetCounterCRUD
+from app.favorite_counts import favorite_counts
+
+db = SessionLocal()
+try:
+    print(f"[OK] Shelter pet counters reset on {ShelterPetCounterCRUD.reconcile(db)} shelters")
+except Exception as e:
+    print(f"[ERROR] Could not reconcile shelter pet counters: {e}")
+    sys.exit(1)
+finally:
+    db.close()
+
+fixed = favorite_counts.reconcile()
+if fixed is None:
+    print("[SKIPPED] Favorites changed recently or the database was unavailable; try again later")
+    sys.exit(1)
+print(f"[OK] Favorite counts reset on {fixed} pets")
@@ -0,0 +1,94 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Configure the app before it is imported: a throwaway SQLite database, in-process
+# rate-limit store, inline password hashing and limits high enough for the tests.
+_tmp_dir = tempfile.mkdtemp(prefix="pawtner-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp_dir}/test.db"
+os.environ["RATE_LIMIT_STORAGE_URI"] = "memory://"
+os.environ["JWT_SECRET_KEY"] = "test-secret"
+os.environ["PASSWORD_HASH_WORKERS"] = "0"
+os.environ["BCRYPT_ROUNDS"] = "4"
+for name in ("REGISTER", "LOGIN", "REFRESH"):
+    os.environ[f"RATE_LIMIT_{name}"] = "1000/minute"
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(BACKEND_DIR)
+
+from fastapi.testclient import TestClient  # noqa: E402
+from app import cache  # noqa: E402
+from app.database import Base, SessionLocal, engine  # noqa: E402
+from app.favorite_counts import favorite_counts  # noqa: E402
+from app.main import app  # noqa: E402
+from app.revocation import revocation_list  # noqa: E402
+from app.shared_store import shared_store  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def fresh_database():
+    """Empty tables and process-wide caches for every test"""
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    shared_store.reset()
+    cache.principal_cache.clear()
+    cache.pet_detail_cache.clear()
+    db = SessionLocal()
+    try:
+        revocation_list.load(db)
+    finally:
+        db.close()
+    yield
+    favorite_counts.flush()
+
+
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def register_shelter(client, email="shelter@example.com", password="password1"):
+    """Register and log in a shelter; returns (shelter_id, auth headers, login response)"""
+    response = client.post("/shelters/register", json={
+        "name": "Happy Tails", "email": email, "password": password, "city": "Austin", "state": "TX"
+    })
+    assert response.status_code == 200, response.text
+    login = client.post("/auth/login", json={"email": email, "password": password})
+    assert login.status_code == 200, login.text
+    tokens = login.json()
+    return response.json()["id"], {"Authorization": f"Bearer {tokens['access_token']}"}, tokens
+
+
+def register_adopter(client, email="adopter@example.com", password="password1"):
+    """Register and log in an adopter; returns (user_id, auth headers, login response)"""
+    response = client.post("/users", json={
+        "email": email, "username": email.split("@")[0], "password": password, "full_name": "Ada Adopter"
+    })
+    assert response.status_code == 200, response.text
+    login = client.post("/auth/login", json={"email": email, "password": password})
+    assert login.status_code == 200, login.text
+    tokens = login.json()
+    return response.json()["id"], {"Authorization": f"Bearer {tokens['access_token']}"}, tokens
+
+
+def create_pet(client, headers, **overrides):
+    """Create a pet for the logged-in shelter, skipping the duplicate check; returns its id"""
+    pet = {
+        "name": "Rex", "pet_type": "dog", "breed": "Labrador", "age_years": 2, "size": "medium",
+        "temperament": "friendly", "adoption_fee": 50.0, "shelter_id": 0, **overrides
+    }
+    response = client.post("/pets?override_duplicate=true", headers=headers, json=pet)
+    assert response.status_code == 200, response.text
+    return response.json()["id"]
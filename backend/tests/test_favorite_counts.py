@@ -0,0 +1,107 @@
+from contextlib import contextmanager
+
+from sqlalchemy import event, text
+
+from app import models
+from app.database import engine
+from app.favorite_counts import favorite_counts
+from app.shared_store import shared_store
+
+from conftest import create_pet, register_adopter, register_shelter
+
+
+@contextmanager
+def count_updates():
+    """Collect the UPDATE statements sent to the database"""
+    updates = []
+
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("UPDATE PETS"):
+            updates.append((statement, executemany))
+
+    event.listen(engine, "before_cursor_execute", before_execute)
+    try:
+        yield updates
+    finally:
+        event.remove(engine, "before_cursor_execute", before_execute)
+
+
+def stored_counts(db, pet_ids):
+    db.expire_all()
+    return [db.get(models.Pet, pet_id).favorite_count for pet_id in pet_ids]
+
+
+def setup_pets(client, count=3):
+    _, shelter_headers, _ = register_shelter(client)
+    pet_ids = [create_pet(client, shelter_headers, name=f"Pet {i}") for i in range(count)]
+    user_id, headers, _ = register_adopter(client)
+    return user_id, headers, pet_ids
+
+
+def test_sync_is_buffered_until_flush(client, db):
+    user_id, headers, pet_ids = setup_pets(client)
+
+    response = client.post(f"/users/{user_id}/favorites/sync", headers=headers, json={"operations": [
+        {"pet_id": pet_ids[0], "action": "add"},
+        {"pet_id": pet_ids[1], "action": "add"},
+        {"pet_id": pet_ids[2], "action": "add"},
+        {"pet_id": pet_ids[2], "action": "remove"},
+    ]})
+
+    assert response.status_code == 200, response.text
+    assert sorted(response.json()["added"]) == pet_ids[:2]
+    assert stored_counts(db, pet_ids) == [0, 0, 0]
+    assert favorite_counts.pending(pet_ids[0]) == 1
+    detail = client.get(f"/pets/{pet_ids[0]}/detail", headers=headers).json()
+    assert detail["favorites_count"] == 1
+
+    with count_updates() as updates:
+        assert favorite_counts.flush() == 2
+
+    assert stored_counts(db, pet_ids) == [1, 1, 0]
+    assert favorite_counts.pending(pet_ids[0]) == 0
+    assert len(updates) == 1 and updates[0][1], "deltas should be written as one executemany"
+
+
+def test_add_and_remove_net_out_before_flush(client, db):
+    user_id, headers, pet_ids = setup_pets(client)
+    other_id, other_headers, _ = register_adopter(client, email="other@example.com")
+
+    client.post(f"/users/{user_id}/favorites/{pet_ids[0]}", headers=headers)
+    client.post(f"/users/{other_id}/favorites/{pet_ids[0]}", headers=other_headers)
+    client.post(f"/users/{user_id}/favorites/{pet_ids[1]}", headers=headers)
+    client.delete(f"/users/{user_id}/favorites/{pet_ids[1]}", headers=headers)
+    # adding twice does not count twice
+    client.post(f"/users/{user_id}/favorites/{pet_ids[0]}", headers=headers)
+
+    with count_updates() as updates:
+        assert favorite_counts.flush() == 1
+
+    assert stored_counts(db, pet_ids) == [2, 0, 0]
+    assert len(updates) == 1
+
+    client.post(f"/users/{user_id}/favorites/sync", headers=headers, json={"operations": [
+        {"pet_id": pet_ids[0], "action": "remove"}
+    ]})
+    favorite_counts.flush()
+    assert stored_counts(db, pet_ids) == [1, 0, 0]
+
+
+def test_flush_with_nothing_pending_writes_nothing(client):
+    with count_updates() as updates:
+        assert favorite_counts.flush() == 0
+    assert updates == []
+
+
+def test_reconcile_waits_for_quiet_period(client, db):
+    user_id, headers, pet_ids = setup_pets(client)
+    client.post(f"/users/{user_id}/favorites/{pet_ids[0]}", headers=headers)
+    db.execute(text("UPDATE pets SET favorite_count = 5 WHERE id = :id"), {"id": pet_ids[1]})
+    db.commit()
+
+    assert favorite_counts.reconcile() is None
+    assert stored_counts(db, pet_ids) == [1, 5, 0]
+
+    shared_store.clear(favorite_counts.ACTIVITY_KEY)
+    assert favorite_counts.reconcile() == 1
+    assert stored_counts(db, pet_ids) == [1, 0, 0]
@@ -0,0 +1,84 @@
+import pytest
+from sqlalchemy import text
+
+from conftest import create_pet, register_shelter
+
+NAMES = ["Bella", "Max", "Bella", "Coco", "Max", "Luna", "Bella", "Ziggy", "Ace"]
+# Stored text as server defaults ('HH:MM:SS') and the ORM ('HH:MM:SS.ffffff') leave it,
+# with ties and several rows inside one second
+CREATED_AT = [
+    "2024-05-01 12:00:00", "2024-05-01 12:00:00.250000", "2024-05-01 12:00:00",
+    "2024-05-01 12:00:00.000000", "2024-05-01 12:00:00.250000", "2024-05-01 12:00:00.000001",
+    "2024-05-02 09:30:00", "2024-05-01 12:00:01", "2024-05-02 09:30:00.000000",
+]
+
+
+@pytest.fixture
+def inventory(client, db):
+    """A shelter with pets whose names and creation times tie"""
+    shelter_id, headers, _ = register_shelter(client)
+    pet_ids = [create_pet(client, headers, name=name) for name in NAMES]
+    for pet_id, created_at in zip(pet_ids, CREATED_AT):
+        db.execute(text("UPDATE pets SET created_at = :created_at WHERE id = :id"), {
+            "created_at": created_at, "id": pet_id
+        })
+    db.commit()
+    return shelter_id, headers, pet_ids
+
+
+def walk(client, headers, shelter_id, **params):
+    """Follow next_cursor to the end; returns the pages"""
+    pages, cursor = [], None
+    while True:
+        query = dict(params, **({"cursor": cursor} if cursor else {}))
+        response = client.get(f"/shelters/{shelter_id}/pets", headers=headers, params=query)
+        assert response.status_code == 200, response.text
+        body = response.json()
+        pages.append(body["pets"])
+        cursor = body["next_cursor"]
+        if cursor is None:
+            return pages
+        assert len(pages) <= len(NAMES), "pagination did not terminate"
+
+
+@pytest.mark.parametrize("sort", ["newest", "oldest", "name", "name_desc"])
+@pytest.mark.parametrize("limit", [1, 2, 4, 9])
+def test_pages_return_every_pet_once_in_order(client, inventory, sort, limit):
+    shelter_id, headers, pet_ids = inventory
+
+    pages = walk(client, headers, shelter_id, sort=sort, limit=limit)
+
+    pets = [pet for page in pages for pet in page]
+    assert sorted(pet["id"] for pet in pets) == sorted(pet_ids)
+    assert all(len(page) == limit for page in pages[:-1])
+    assert pages[-1]
+    key, descending = {
+        "newest": ("created_at", True), "oldest": ("created_at", False),
+        "name": ("name", False), "name_desc": ("name", True),
+    }[sort]
+    order = [(pet[key], pet["id"]) for pet in pets]
+    assert order == sorted(order, reverse=descending)
+
+
+def test_status_filter_pages_only_matching_pets(client, inventory):
+    shelter_id, headers, pet_ids = inventory
+    pending = pet_ids[1::2]
+    client.post("/pets/bulk-status", headers=headers, json={"pet_ids": pending, "adoption_status": "pending"})
+
+    pages = walk(client, headers, shelter_id, status="pending", sort="name", limit=2)
+
+    pets = [pet for page in pages for pet in page]
+    assert sorted(pet["id"] for pet in pets) == sorted(pending)
+    assert {pet["adoption_status"] for pet in pets} == {"pending"}
+
+
+def test_cursor_is_tied_to_its_sort(client, inventory):
+    shelter_id, headers, _ = inventory
+    first = client.get(f"/shelters/{shelter_id}/pets", headers=headers, params={"sort": "name", "limit": 2})
+
+    response = client.get(f"/shelters/{shelter_id}/pets", headers=headers, params={
+        "sort": "newest", "limit": 2, "cursor": first.json()["next_cursor"]
+    })
+
+    assert response.status_code == 400
+    assert client.get(f"/shelters/{shelter_id}/pets", headers=headers, params={"cursor": "garbage"}).status_code == 400
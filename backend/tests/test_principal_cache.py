@@ -0,0 +1,71 @@
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from app import cache, models
+from app.database import async_engine, engine
+
+from conftest import create_pet, register_adopter, register_shelter
+
+
+@contextmanager
+def principal_selects(table):
+    """Collect the SELECTs that read rows of `table`, through the sync or async engine"""
+    selects = []
+
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT") and f"FROM {table}" in statement:
+            selects.append(statement)
+
+    engines = (engine, async_engine.sync_engine)
+    for target in engines:
+        event.listen(target, "before_cursor_execute", before_execute)
+    try:
+        yield selects
+    finally:
+        for target in engines:
+            event.remove(target, "before_cursor_execute", before_execute)
+
+
+def test_favorite_toggles_are_served_from_the_cache(client):
+    _, shelter_headers, _ = register_shelter(client)
+    pet_id = create_pet(client, shelter_headers)
+    user_id, headers, _ = register_adopter(client)
+    client.get(f"/users/{user_id}/favorites", headers=headers)
+
+    with principal_selects("users") as selects:
+        added = client.post(f"/users/{user_id}/favorites/{pet_id}", headers=headers)
+        removed = client.delete(f"/users/{user_id}/favorites/{pet_id}", headers=headers)
+
+    assert added.status_code == 200, added.text
+    assert removed.status_code == 200, removed.text
+    assert selects == []
+
+
+def test_invalidation_reaches_cached_writers(client, db):
+    shelter_id, headers, _ = register_shelter(client)
+    pet_id = create_pet(client, headers)
+    assert client.put(f"/pets/{pet_id}", headers=headers, json={"adoption_status": "pending"}).status_code == 200
+
+    db.get(models.Shelter, shelter_id).is_active = False
+    db.commit()
+    cache.invalidate_principal("shelter", shelter_id)
+
+    response = client.post("/pets/bulk-status", headers=headers, json={
+        "pet_ids": [pet_id], "adoption_status": "adopted"
+    })
+    assert response.status_code == 403
+
+
+def test_cached_snapshot_is_used_only_without_a_marker(client):
+    user_id, headers, _ = register_adopter(client)
+    client.get(f"/users/{user_id}/favorites", headers=headers)
+
+    with principal_selects("users") as selects:
+        client.get(f"/users/{user_id}/favorites", headers=headers)
+    assert selects == []
+
+    cache.invalidate_principal("user", user_id)
+    with principal_selects("users") as selects:
+        client.get(f"/users/{user_id}/favorites", headers=headers)
+    assert len(selects) == 1
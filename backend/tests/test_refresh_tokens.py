@@ -0,0 +1,56 @@
+from app import models
+
+from conftest import register_adopter, register_shelter
+
+
+def test_refresh_issues_a_new_pair(client):
+    user_id, _, tokens = register_adopter(client)
+
+    response = client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+
+    assert response.status_code == 200
+    refreshed = response.json()
+    assert refreshed["refresh_token"] != tokens["refresh_token"]
+    me = client.get(f"/users/{user_id}", headers={"Authorization": f"Bearer {refreshed['access_token']}"})
+    assert me.status_code == 200
+
+
+def test_refresh_token_cannot_be_reused(client):
+    _, _, tokens = register_adopter(client)
+
+    first = client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    second = client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+
+    assert first.status_code == 200
+    assert second.status_code == 401
+    # the pair issued by the first refresh keeps working
+    third = client.post("/auth/refresh", json={"refresh_token": first.json()["refresh_token"]})
+    assert third.status_code == 200
+
+
+def test_access_token_is_not_a_refresh_token(client):
+    _, _, tokens = register_adopter(client)
+
+    response = client.post("/auth/refresh", json={"refresh_token": tokens["access_token"]})
+
+    assert response.status_code == 401
+
+
+def test_logout_revokes_the_refresh_token(client):
+    _, headers, tokens = register_adopter(client)
+
+    logout = client.post("/auth/logout", headers=headers, json={"refresh_token": tokens["refresh_token"]})
+    refresh = client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+
+    assert logout.status_code == 200
+    assert refresh.status_code == 401
+
+
+def test_suspended_shelter_cannot_refresh(client, db):
+    shelter_id, _, tokens = register_shelter(client)
+    db.get(models.Shelter, shelter_id).is_active = False
+    db.commit()
+
+    response = client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+
+    assert response.status_code == 403
@@ -0,0 +1,113 @@
+from sqlalchemy import event
+
+from app import models
+from app.crud import ShelterPetCounterCRUD
+from app.database import engine
+
+from conftest import create_pet, register_shelter
+
+EMPTY = {"total": 0, "available": 0, "pending": 0, "adopted": 0, "on_hold": 0}
+
+
+def counter_row(db, shelter_id):
+    db.expire_all()
+    counter = db.get(models.ShelterPetCounter, shelter_id)
+    assert counter is not None
+    return {column: getattr(counter, column) for column in EMPTY}
+
+
+def inventory_counts(client, headers, shelter_id):
+    response = client.get(f"/shelters/{shelter_id}/pets", headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()["counts"]
+
+
+def test_registration_creates_counter_row(client, db):
+    shelter_id, headers, _ = register_shelter(client)
+
+    assert counter_row(db, shelter_id) == EMPTY
+    assert inventory_counts(client, headers, shelter_id) == EMPTY
+
+
+def test_create_update_and_delete_move_counters(client, db):
+    shelter_id, headers, _ = register_shelter(client)
+    rex = create_pet(client, headers, name="Rex")
+    create_pet(client, headers, name="Max")
+
+    assert counter_row(db, shelter_id) == {**EMPTY, "total": 2, "available": 2}
+
+    response = client.put(f"/pets/{rex}", headers=headers, json={"adoption_status": "pending"})
+    assert response.status_code == 200, response.text
+    assert counter_row(db, shelter_id) == {**EMPTY, "total": 2, "available": 1, "pending": 1}
+
+    response = client.delete(f"/pets/{rex}", headers=headers)
+    assert response.status_code == 200, response.text
+    assert counter_row(db, shelter_id) == {**EMPTY, "total": 1, "available": 1}
+    assert inventory_counts(client, headers, shelter_id) == counter_row(db, shelter_id)
+
+
+def test_bulk_status_moves_counters(client, db):
+    shelter_id, headers, _ = register_shelter(client)
+    pet_ids = [create_pet(client, headers, name=f"Pet {i}") for i in range(4)]
+    client.put(f"/pets/{pet_ids[0]}", headers=headers, json={"adoption_status": "on_hold"})
+
+    response = client.post("/pets/bulk-status", headers=headers, json={
+        "pet_ids": pet_ids[:3], "adoption_status": "adopted"
+    })
+
+    assert response.status_code == 200, response.text
+    assert counter_row(db, shelter_id) == {**EMPTY, "total": 4, "available": 1, "adopted": 3}
+
+
+def test_bulk_status_applies_deltas_without_recounting(client, db):
+    shelter_id, headers, _ = register_shelter(client)
+    pet_ids = [create_pet(client, headers, name=f"Pet {i}") for i in range(5)]
+    client.put(f"/pets/{pet_ids[0]}", headers=headers, json={"adoption_status": "pending"})
+    client.put(f"/pets/{pet_ids[1]}", headers=headers, json={"adoption_status": "on_hold"})
+    client.put(f"/pets/{pet_ids[2]}", headers=headers, json={"adoption_status": "adopted"})
+    statements = []
+
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_execute)
+    try:
+        response = client.post("/pets/bulk-status", headers=headers, json={
+            "pet_ids": pet_ids, "adoption_status": "adopted"
+        })
+    finally:
+        event.remove(engine, "before_cursor_execute", before_execute)
+
+    assert response.status_code == 200, response.text
+    assert response.json()["unchanged_ids"] == [pet_ids[2]]
+    assert not [statement for statement in statements if "count(" in statement.lower()]
+    assert counter_row(db, shelter_id) == {**EMPTY, "total": 5, "adopted": 5}
+
+
+def test_bulk_status_ignores_other_shelters_pets(client, db):
+    shelter_id, headers, _ = register_shelter(client)
+    other_id, other_headers, _ = register_shelter(client, email="other@example.com")
+    own = create_pet(client, headers)
+    foreign = create_pet(client, other_headers)
+
+    client.post("/pets/bulk-status", headers=headers, json={
+        "pet_ids": [own, foreign], "adoption_status": "pending"
+    })
+
+    assert counter_row(db, shelter_id) == {**EMPTY, "total": 1, "pending": 1}
+    assert counter_row(db, other_id) == {**EMPTY, "total": 1, "available": 1}
+
+
+def test_reconcile_repairs_drift_and_missing_rows(client, db):
+    shelter_id, headers, _ = register_shelter(client)
+    other_id, other_headers, _ = register_shelter(client, email="other@example.com")
+    create_pet(client, headers)
+    create_pet(client, other_headers)
+    db.get(models.ShelterPetCounter, shelter_id).available = 7
+    db.delete(db.get(models.ShelterPetCounter, other_id))
+    db.commit()
+
+    assert ShelterPetCounterCRUD.reconcile(db) == 2
+    assert counter_row(db, shelter_id) == {**EMPTY, "total": 1, "available": 1}
+    assert counter_row(db, other_id) == {**EMPTY, "total": 1, "available": 1}
+    assert ShelterPetCounterCRUD.reconcile(db) == 0